@@ -29,20 +29,36 @@
 # macGH 26.03.2024  Version 0.1.6: Update system config
 # macGH 13.05.2024  Version 0.1.7: Set Output to 0 too low or high, val is changed to min/max out value of device, added decode NPB Curve
 # macGH 24.09.2024  Version 0.1.8: Addad Fanspeed for BIC2200
-
-
+# agent 19.10.2026  Version 0.1.9: Prebuilt read/write frames, decode replies from msg.data instead of string split
+# agent 19.10.2026  Version 0.2.0: CAN interface name configurable per instance (can0, can1, ...)
+# agent 19.10.2026  Version 0.2.1: Added group_write, one setpoint to all paralleled units with one broadcast frame
+# agent 19.10.2026  Version 0.2.2: Added can_discover / mwcandiscover, scan all IDs of both families at once
+# agent 19.10.2026  Version 0.2.3: Added can_read_multi, pipelined reads matched by command code
+# agent 19.10.2026  Version 0.2.4: can_restart tiered recovery, resync of cached setpoints, recovery metric
+# agent 19.10.2026  Version 0.2.5: Receive timeout CAN_TIMEOUT configurable, used by mwcansched
+#                                  can_receive skips frames of other devices and stale replies of other commands
+# agent 19.10.2026  Version 0.2.6: Token bucket transmit pacing per device and per bus with automatic rate tuning
+# agent 19.10.2026  Version 0.2.7: Energy and charge counters (Wh / Ah) per device from reply timestamps
+# agent 19.10.2026  Version 0.2.8: Per command statistics with latency histograms, stats() / stats_reset(), hooks
+# agent 19.10.2026  Version 0.2.9: Lazy import of can, ifcfg, configparser, json. Added connect() fast path with identity cache
+# agent 19.10.2026  Version 0.3.0: Direct SLCAN backend, python-can opens the USB-CAN adapter without slcand / ip link / sudo
+# agent 19.10.2026  Version 0.3.1: Dynamic control mode, EEPROM off / delayed write during frequent setpoint writes
+#                                  Fixed decode of system config bit 8-9
+# agent 19.10.2026  Version 0.3.2: More processes on one CAN interface: interface lock, user count, request ownership
+
+
+#can, ifcfg, configparser and json are imported when first used, keeps "import mwcan" fast
 import os
-import can
-import ifcfg
-import configparser
 import logging
+import threading
+import time
 
 ######################################################################################
 # Explanations
 ######################################################################################
 
 ######################################################################################
-# def __init__(self, usedmwdev, mwcanid, devpath, loglevel):
+# def __init__(self, usedmwdev, mwcanid, devpath, loglevel, caniface="can0", backend=CAN_BACKEND_SOCKETCAN):
 #
 # usedmwdev = Meanwell device
 # 0 = BIC2200
@@ -65,6 +81,172 @@ import logging
 # INFO       20
 # DEBUG      10
 # NOTSET      0
+#
+# caniface
+# Name of the CAN interface the device is connected to, default "can0"
+# Use "can1", ... if more than one USB-CAN adapter is used
+#
+# backend
+# CAN_BACKEND_SOCKETCAN = kernel interface caniface, created with slcand + ip link (sudo)
+#                         by can_up if it does not exist
+# CAN_BACKEND_SLCAN     = python-can opens devpath directly with the slcan protocol at
+#                         CAN_BITRATE, no slcand, no ip link, no root needed.
+#                         Only this instance can use the adapter (share it with can_up(bus=...)),
+#                         caniface is only the name for logs, pacing and identity cache
+######################################################################################
+
+######################################################################################
+# def group_write(self, setfunc, val, ids=None, peers=None):
+#
+# Write the same setpoint to all paralleled units of the same device type
+# setfunc = any write function with (rw,val) parameter, e.g. candev.BIC_discharge_i
+# ids     = None: one frame to the broadcast address (CAN_BROADCAST_ID)
+#           list of device IDs ["00","01",...]: one frame per unit, back to back
+# peers   = other mwcan instances on the same Bus (mwcanfleet), their devices are
+#           addressed by the frames too
+# The value is limited with the min/max values of this instance
+# Devices do not answer broadcast frames, read back every unit if needed
+# The setpoint is cached for every addressed unit (resync after can_restart) and
+# counts as EEPROM write of the unit for dynamic_control:
+# every unit of ids, with broadcast every known unit of this device type
+######################################################################################
+
+######################################################################################
+# def can_discover(self, window=0.3):
+# def mwcandiscover(caniface="can0", devpath="", window=0.3, loglevel=20):
+#
+# Find all devices on the bus. The type request 0x0082 + 0x0083 is sent to every
+# BIC-2200 (00-07) and NPB (00-03) address at once, the replies are collected
+# by their reply ID (0x000C02xx / 0x000C00xx) within one window (seconds)
+# mwcandiscover brings the interface up and down, can_discover uses an open bus
+# mwcandiscover(..., backend=CAN_BACKEND_SLCAN) opens devpath directly
+# Returns a list of found devices:
+# [{"usedmwdev": 0, "mwcanid": "00", "model": "BIC-2200-24", "limits": {...}}, ...]
+# limits are the mwcan.ini values of the model, same format as the dev_ values
+######################################################################################
+
+######################################################################################
+# def can_restart(self):
+#
+# Recovery after bus-off or adapter problems, fastest tier first:
+# 1 = reopen the python-can Bus only
+# 2 = restart the link (ip link down/up), interface is kept, skipped with CAN_BACKEND_SLCAN
+# 3 = can_down / can_up, the interface is created again if it was created by us
+# A tier is done if the device answers again. Afterwards all setpoints written
+# before (cached per device) are read back pipelined and written again if different.
+# CAN_RECOVERY = {"count", "tier", "time" (s), "resync", "resync_fixed"} of the last recovery
+# Only the owner of the Bus can restart it: an instance with can_up(bus=...) returns 0
+# and does nothing. Restart the owner, give all instances its new Bus (can0) and call
+# their can_resync, mwcanfleet.iface_restart does this for all devices of an interface.
+######################################################################################
+
+######################################################################################
+# Transmit pacing
+#
+# Every read goes through two token buckets: one per device and one per CAN
+# interface (shared by all instances on it), so pipelined reads do not overrun the
+# device or the adapter. Writes only use the bucket of the interface, a slow read
+# rate never delays a setpoint or operation off.
+# The device rate is tuned automatically: every answered read raises it a bit,
+# timeouts of PACER_BACKOFF_CMDS different commands without an answer in between
+# halve it (PACER_MIN_RATE .. PACER_MAX_RATE). A register the device does not
+# support, timing out again and again, does not slow the device down.
+# The interface rate is PACER_BUS_SHARE of CAN_BITRATE in request + reply pairs.
+# def can_probe_rate(self, count=20):  find the highest rate the device answers
+#                                      without drops and start from there
+# def tx_rate(self):                   {"device": req/s, "bus": req/s}
+# mwcanbuspacer(caniface).rate = ...   set the fixed rate of the interface
+# rate 0 = no pacing
+######################################################################################
+
+######################################################################################
+# Energy and charge counters
+#
+# Every v_out_read / i_out_read reply (also pipelined ones) updates the counters of
+# the device with the kernel receive timestamp of the reply. Voltage and current
+# are held between their samples, so reads at different times are integrated right.
+# Positive current = charge battery, negative current (BIC-2200) = discharge battery
+# Gaps longer than ENERGY_MAX_GAP seconds are not integrated.
+#
+# def energy_read(self):        {"charge_Wh", "discharge_Wh", "charge_Ah", "discharge_Ah"}
+#                               no bus access
+# def energy_persist(self, path): load counters from path and save them there every
+#                               ENERGY_SAVE_INTERVAL seconds and at can_down
+# def energy_reset(self):
+######################################################################################
+
+######################################################################################
+# Statistics
+#
+# def stats(self):        statistics of all devices of this instance
+# {"0x000c0300": {"dropped": frames of other devices / stale replies skipped,
+#                 "commands": {"0x0060": {"requests", "replies", "timeouts", "tx_bytes", "rx_bytes",
+#                                         "latency_ms": {"min", "mean", "p50", "p90", "p99", "max"}}}}}
+# def stats_reset(self):
+#
+# Latency = kernel receive timestamp of the reply - time of send, kept in a histogram
+# with 16 buckets per power of two (us), so percentiles are exact to ~6 %
+#
+# Hooks for external profilers, None = off:
+# CAN_HOOK_PRE(dev, cmd, msg)           before a request is sent, cmd = 0x0060 ...
+# CAN_HOOK_POST(dev, cmd, value, latency) after a reply (latency s) or timeout (value -1, latency None)
+######################################################################################
+
+######################################################################################
+# Dynamic control mode (EEPROM wear)
+#
+# By default every setpoint write is saved to the EEPROM of the device at once
+# (SYSTEM_CONFIG bit 8-9 = 0, bit 10 = 0). A battery controller writing every few
+# seconds wears it out. With dynamic control the writes per device are counted:
+# DYNAMIC_ENTER_WRITES writes within DYNAMIC_WINDOW seconds --> SYSTEM_CONFIG is read
+# and written again with one frame:
+#   DYNAMIC_EEP_OFF   = bit 10 set, nothing is saved while in the mode
+#   DYNAMIC_EEP_DELAY = bit 8-9 = delay, saved when parameters are unchanged for 1 / 10 minutes
+# No write for DYNAMIC_EXIT_IDLE seconds or can_down --> the old SYSTEM_CONFIG is written
+# back and the last value of every parameter changed in the mode is written once more,
+# so it is in the EEPROM.
+# Writes of a parameter replaced by a newer value before it was saved are counted as avoided.
+#
+# def dynamic_control(self, mode=DYNAMIC_EEP_OFF, delay=EEP_CONFIG_1MIN,
+#                     enter=DYNAMIC_ENTER_WRITES, idle=DYNAMIC_EXIT_IDLE):
+#                               for the current device, mode DYNAMIC_OFF = leave and stop
+# def dynamic_state(self):      {"active", "writes", "commits", "avoided", "enter", "exit"}
+#
+# SYSTEM_CONFIG itself is stored in the device. If the program is killed in the mode,
+# the device stays in it until dynamic_control / system_config restores it.
+######################################################################################
+
+######################################################################################
+# More processes on one CAN interface (e.g. mwcancmd.py while a service is running)
+#
+# can_up / connect / can_down hold an advisory lock (flock LOCK_DIR/<caniface>.lock)
+# while the interface is checked, created or removed, and keep the PIDs of all
+# processes using it in this lock file. The interface is only removed by the last
+# process and only if it was created by mwcan (slcand / ip link).
+# PIDs of processes which are gone are removed at the next can_up / can_down.
+# LOCK_DIR must be a directory with mode 1777 (created so if missing), otherwise
+# can_up / connect fail. If the users can not be read, can_down keeps the interface.
+#
+# CAN_OWNERSHIP = True (default False, set it in all processes):
+# a read holds a lock for its device address + command code (lockf range of
+# LOCK_DIR/<caniface>.cmd) from the request until the reply, so one process at a
+# time asks for the same register. Replies received before our own request
+# (kernel timestamp) are skipped, they belong to a request of another process.
+# Locks of a killed process are released by the kernel.
+# Not for CAN_BACKEND_SLCAN, the adapter can only be opened by one process.
+######################################################################################
+
+######################################################################################
+# def connect(self, mwtype=""):
+#
+# Fast path instead of can_up for short running tools.
+# Trusts that the CAN interface is already up (no interface check, no slcand / ip link)
+# and takes the device type from mwtype or from the identity cache (IDENTITY_CACHE).
+# Only if the device is not in the cache the type is read once and stored with the
+# mwcan.ini values, so mwcan.ini is not parsed on later starts.
+# The process is counted as user of the interface, but can_down after connect never
+# removes the interface, also not as last user. A later can_up user removes it if
+# it was created by mwcan.
 ######################################################################################
 
 
@@ -76,12 +258,33 @@ DEV_NPB      = 1
 DEV_CAN0     = 0
 DEV_RS232    = 1
 
+#CAN address prefix controller to device / device to controller
+CAN_ADR_PREFIX   = {DEV_BIC_2200: ("0x000C03", "000c02"), DEV_NPB: ("0x000C01", "000c00")}
+#Device ID all units listen to, units do not reply to it
+CAN_BROADCAST_ID = "FF"
+#Device IDs per device type
+CAN_IDS          = {DEV_BIC_2200: ["00","01","02","03","04","05","06","07"], DEV_NPB: ["00","01","02","03"]}
+
+#Backends
+CAN_BACKEND_SOCKETCAN = "socketcan"
+CAN_BACKEND_SLCAN     = "slcan"
+CAN_BITRATE           = 250000
+#seconds python-can waits after opening the serial port before the slcan setup,
+#adapters which reset on open (Arduino based) need 2
+SLCAN_OPEN_SLEEP      = 0.1
+
 
 #SYSTEM CONFIG BITS
 SYSTEM_CONFIG_CAN_CTRL       = 0
 SYSTEM_CONFIG_OPERATION_INIT = 1 #BIT1 + BIT2 --> 00 .. 11
+SYSTEM_CONFIG_EEP_CONFIG     = 8 #BIT8 + BIT9 --> 00 .. 11
 SYSTEM_CONFIG_EEP_OFF        = 10
 
+#SYSTEM CONFIG BIT 8-9 values
+EEP_CONFIG_IMMEDIATE = 0
+EEP_CONFIG_1MIN      = 1
+EEP_CONFIG_10MIN     = 2
+
 #SYSTEM STATUS BITS
 SYSTEM_STATUS_M_S           = 0
 SYSTEM_STATUS_DC_OK         = 1
@@ -135,6 +338,399 @@ def clear_bit(value, bit):
 def is_bit(value, bit):
     return bool(value & (1<<bit))
 
+#########################################
+# mwcan.ini
+MWCANINI_INT   = ['Voltage', 'MaxWatt']
+MWCANINI_FLOAT = ['BoostChargeVoltage', 'FloatChargeVoltage', 'MinChargeVoltage', 'MaxChargeVoltage',
+                  'MinChargeCurrent', 'MaxChargeCurrent', 'MinDisChargeVoltage', 'MaxDisChargeVoltage',
+                  'MinDisChargeCurrent', 'MaxDisChargeCurrent']
+mwcanini_config = None
+
+def mwcaninilimits(val):
+    #parameter of device type val from mwcan.ini, values * 100 like dev_ values, None if not found
+    global mwcanini_config
+    if mwcanini_config is None:
+        import configparser
+        mwcanini_config = configparser.ConfigParser()
+        spath = os.path.dirname(os.path.realpath(__file__)) 
+        logging.debug("Ini Path: " + spath + '/mwcan.ini')
+        mwcanini_config.read(spath + '/mwcan.ini')
+    config = mwcanini_config
+    if not config.has_section(val):
+        return None
+    limits = {}
+    for k in MWCANINI_INT:
+        limits[k] = int(config.get(val, k))
+    for k in MWCANINI_FLOAT:
+        limits[k] = round(float(config.get(val, k))*100)
+    return limits
+
+#########################################
+# transmit pacing
+PACER_START_RATE   = 100  #request/s per device at start
+PACER_MIN_RATE     = 5
+PACER_MAX_RATE     = 1000
+PACER_BUS_SHARE    = 0.5  #part of CAN_BITRATE for requests and replies of one interface
+PACER_PAIR_BITS    = 220  #request (2 bytes) + reply (4 bytes), extended frames, worst case stuffing
+PACER_BACKOFF_CMDS = 2    #different commands timed out before the rate is halved
+PACER_BURST        = 1    #requests sent back to back without waiting
+
+class mwcanpacer:
+    #token bucket, rate in requests per second, rate 0 = no pacing
+
+    def __init__(self, rate, burst=PACER_BURST):
+        self.rate   = rate
+        self.burst  = burst
+        self.tokens = burst
+        self.last   = time.monotonic()
+        self.lock   = threading.Lock()
+        self.missed = set() #commands timed out since the last answer
+
+    def acquire(self):
+        if self.rate <= 0: return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                time.sleep(wait)
+                self.last = time.monotonic()
+                self.tokens = 0
+            else:
+                self.tokens -= 1
+
+    def success(self):
+        #additive increase
+        self.missed.clear()
+        if 0 < self.rate < PACER_MAX_RATE:
+            self.rate = min(PACER_MAX_RATE, self.rate + 1)
+
+    def timeout(self,cmds):
+        #multiplicative decrease, only if different commands time out
+        if self.rate <= 0: return
+        self.missed.update(cmds)
+        if len(self.missed) < PACER_BACKOFF_CMDS: return
+        self.missed.clear()
+        self.rate = max(PACER_MIN_RATE, self.rate / 2)
+        logging.debug("mwcanpacer: timeout, rate now " + str(round(self.rate)) + " req/s")
+
+mwcan_buspacers = {}
+
+def mwcanbuspacer(caniface):
+    #one bucket per CAN interface, shared by all instances
+    if caniface not in mwcan_buspacers:
+        mwcan_buspacers[caniface] = mwcanpacer(CAN_BITRATE * PACER_BUS_SHARE / PACER_PAIR_BITS)
+    return mwcan_buspacers[caniface]
+
+#########################################
+# energy counters
+ENERGY_MAX_GAP       = 60  #seconds
+ENERGY_SAVE_INTERVAL = 300 #seconds
+
+class mwcanenergy:
+
+    def __init__(self):
+        self.path = None
+        self.saved = 0
+        self.reset()
+
+    def reset(self):
+        self.counters = {"charge_Wh": 0.0, "discharge_Wh": 0.0, "charge_Ah": 0.0, "discharge_Ah": 0.0}
+        self.v = None #V (0.01)
+        self.i = None #A (0.01)
+        self.t = None #time of the last sample
+
+    def update(self, v, i, t):
+        #integrate the held values up to t, then take the new sample (v or i is None)
+        if self.t is not None and self.v is not None and self.i is not None:
+            dt = t - self.t
+            if 0 < dt <= ENERGY_MAX_GAP:
+                ah = self.i * dt / 360000 #A (0.01) * s --> Ah
+                wh = ah * self.v / 100
+                if ah >= 0:
+                    self.counters["charge_Ah"] += ah
+                    self.counters["charge_Wh"] += wh
+                else:
+                    self.counters["discharge_Ah"] -= ah
+                    self.counters["discharge_Wh"] -= wh
+        if self.t is None or t > self.t: self.t = t
+        if v is not None: self.v = v
+        if i is not None: self.i = i
+        if self.path is not None and self.t - self.saved > ENERGY_SAVE_INTERVAL:
+            self.save()
+
+    def persist(self, path):
+        self.path = path
+        import json
+        if os.path.exists(path):
+            with open(path) as f:
+                self.counters.update(json.load(f))
+            logging.info("mwcanenergy: loaded " + path)
+        self.saved = time.time()
+
+    def save(self):
+        if self.path is None: return
+        self.saved = self.t if self.t is not None else time.time()
+        import json
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.counters, f)
+        os.replace(tmp, self.path)
+
+#########################################
+# statistics
+HIST_SUB  = 16 #buckets per power of two
+HIST_SIZE = HIST_SUB * 22
+
+def hist_index(us):
+    if us < 2 * HIST_SUB: return us
+    e = us.bit_length() - 5
+    return min(HIST_SIZE - 1, HIST_SUB * (e + 1) + (us >> e) - HIST_SUB)
+
+def hist_value(idx):
+    #lowest value of bucket idx in us
+    if idx < 2 * HIST_SUB: return idx
+    e = idx // HIST_SUB - 1
+    return (idx % HIST_SUB + HIST_SUB) << e
+
+class mwcanstat:
+
+    def __init__(self):
+        self.requests = 0
+        self.replies  = 0
+        self.timeouts = 0
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+        self.sent     = 0.0 #time of the last request
+        self.hist     = [0] * HIST_SIZE
+        self.lsum     = 0.0
+        self.lmin     = None
+        self.lmax     = 0.0
+
+    def latency(self, l):
+        self.lsum += l
+        if self.lmin is None or l < self.lmin: self.lmin = l
+        if l > self.lmax: self.lmax = l
+        self.hist[hist_index(int(l * 1000000))] += 1
+
+    def percentile(self, p):
+        n = sum(self.hist)
+        if n == 0: return None
+        limit = n * p / 100
+        c = 0
+        for idx, count in enumerate(self.hist):
+            c += count
+            if c >= limit: return hist_value(idx) / 1000
+        return self.lmax * 1000
+
+    def result(self):
+        n = sum(self.hist)
+        lat = None
+        if n > 0:
+            lat = {"min": self.lmin * 1000, "mean": self.lsum / n * 1000, "p50": self.percentile(50),
+                   "p90": self.percentile(90), "p99": self.percentile(99), "max": self.lmax * 1000}
+        return {"requests": self.requests, "replies": self.replies, "timeouts": self.timeouts,
+                "tx_bytes": self.tx_bytes, "rx_bytes": self.rx_bytes, "latency_ms": lat}
+
+#########################################
+# dynamic control mode, EEPROM writes
+DYNAMIC_OFF          = 0
+DYNAMIC_EEP_OFF      = 1
+DYNAMIC_EEP_DELAY    = 2
+DYNAMIC_WINDOW       = 60  #seconds
+DYNAMIC_ENTER_WRITES = 6   #writes within DYNAMIC_WINDOW
+DYNAMIC_EXIT_IDLE    = 120 #seconds without write
+EEP_DELAY_SECONDS    = {EEP_CONFIG_IMMEDIATE: 0, EEP_CONFIG_1MIN: 60, EEP_CONFIG_10MIN: 600}
+
+class mwcaneeprom:
+
+    def __init__(self):
+        self.mode    = DYNAMIC_OFF
+        self.delay   = EEP_CONFIG_1MIN
+        self.enter   = DYNAMIC_ENTER_WRITES
+        self.idle    = DYNAMIC_EXIT_IDLE
+        self.active  = False
+        self.busy    = False #own writes of enter / leave are not counted
+        self.saved   = None  #SYSTEM_CONFIG before the mode
+        self.times   = []    #write times within DYNAMIC_WINDOW
+        self.pending = set() #parameters written in the mode and not yet saved
+        self.last    = 0.0
+        self.counters = {"writes": 0, "commits": 0, "avoided": 0, "enter": 0, "exit": 0}
+
+    def write(self, cmd, t):
+        #count one setpoint write, returns True if the mode should be entered
+        self.counters["writes"] += 1
+        if self.active:
+            if self.mode == DYNAMIC_EEP_DELAY and t - self.last >= EEP_DELAY_SECONDS[self.delay]:
+                self.counters["commits"] += len(self.pending) #device saved after the quiet time
+                self.pending.clear()
+            if cmd in self.pending:
+                self.counters["avoided"] += 1
+            self.pending.add(cmd)
+            self.last = t
+            return False
+
+        self.counters["commits"] += 1
+        self.last = t
+        self.times.append(t)
+        while self.times and t - self.times[0] > DYNAMIC_WINDOW:
+            del self.times[0]
+        return len(self.times) >= self.enter
+
+    def config(self, val):
+        #SYSTEM_CONFIG for the mode, bits 8-10 changed in one value
+        if self.mode == DYNAMIC_EEP_OFF:
+            return val | (1 << SYSTEM_CONFIG_EEP_OFF)
+        val &= ~(0b11 << SYSTEM_CONFIG_EEP_CONFIG)
+        return val | (self.delay << SYSTEM_CONFIG_EEP_CONFIG)
+
+    def expired(self, t):
+        return self.active and not self.busy and t - self.last >= self.idle
+
+    def result(self):
+        r = dict(self.counters)
+        r["active"] = self.active
+        return r
+
+#########################################
+# identity cache, device type and mwcan.ini values per interface and address
+IDENTITY_CACHE = os.path.expanduser("~/.cache/mwcan_identity.json")
+
+def identity_cache_read(key):
+    import json
+    try:
+        with open(IDENTITY_CACHE) as f:
+            return json.load(f).get(key)
+    except (OSError, ValueError):
+        return None
+
+def identity_cache_write(key, mwtype, limits):
+    import json
+    try:
+        with open(IDENTITY_CACHE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[key] = {"type": mwtype, "limits": limits}
+    try:
+        os.makedirs(os.path.dirname(IDENTITY_CACHE), exist_ok=True)
+        tmp = IDENTITY_CACHE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp, IDENTITY_CACHE)
+    except OSError as err:
+        logging.debug("identity cache not written: " + str(err))
+
+#########################################
+# coordination of more processes on one CAN interface
+LOCK_DIR = "/tmp/mwcan"
+
+mwcan_lockfiles = {}
+
+def lock_dir():
+    #LOCK_DIR is shared by all users (root for slcand / ip link, the service user, ...)
+    #it must be a real directory with mode 1777, files in it are opened without following links
+    import stat
+    try:
+        os.mkdir(LOCK_DIR, 0o700)
+        os.chmod(LOCK_DIR, 0o1777) #explicit, mkdir is masked by the umask
+    except FileExistsError:
+        pass
+    st = os.lstat(LOCK_DIR)
+    if not stat.S_ISDIR(st.st_mode):
+        raise OSError(LOCK_DIR + " is no directory")
+    if st.st_uid not in (0, os.geteuid()):
+        raise OSError(LOCK_DIR + " belongs to user " + str(st.st_uid))
+    if stat.S_IMODE(st.st_mode) != 0o1777:
+        if st.st_uid != os.geteuid():
+            raise OSError(LOCK_DIR + " has mode " + oct(stat.S_IMODE(st.st_mode)) + ", needs 1777")
+        os.chmod(LOCK_DIR, 0o1777)
+    return LOCK_DIR
+
+def lock_file(caniface, kind):
+    #one fd per file and process, closing a second fd of the file would drop all lockf locks
+    import stat
+    key = caniface + "." + kind
+    if key not in mwcan_lockfiles:
+        try:
+            path = os.path.join(lock_dir(), key)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW | os.O_CLOEXEC, 0o666)
+        except OSError as err:
+            raise Exception("mwcan: lock file " + key + " not usable: " + str(err))
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or st.st_nlink != 1:
+            os.close(fd)
+            raise Exception("mwcan: lock file " + key + " is no plain file")
+        if st.st_uid == os.geteuid():
+            os.fchmod(fd, 0o666) #processes of other users (sudo) use it too
+        mwcan_lockfiles[key] = fd
+    return mwcan_lockfiles[key]
+
+def iface_lock(caniface):
+    import fcntl
+    fd = lock_file(caniface, "lock")
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+def iface_unlock(fd):
+    import fcntl
+    fcntl.flock(fd, fcntl.LOCK_UN)
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass #process of another user
+    return True
+
+def iface_users(lockfd, add=None, remove=None, created=None):
+    #only with iface_lock, the users are kept in the lock file itself
+    #(no temp file / rename, other users can not replace files in the sticky directory)
+    #created None = unchanged, returns (PIDs using the interface, created by mwcan)
+    import json
+    data = {"created": False, "pids": []}
+    raw = b""
+    try:
+        os.lseek(lockfd, 0, os.SEEK_SET)
+        while True:
+            chunk = os.read(lockfd, 4096)
+            if not chunk: break
+            raw += chunk
+    except OSError as err:
+        raise Exception("mwcan: users of the interface not readable: " + str(err))
+    if raw:
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            logging.error("iface users: " + LOCK_DIR + " lock file damaged, started new")
+    pids = [pid for pid in data["pids"] if pid_alive(pid)]
+    if add is not None:
+        pids.append(add)
+    if remove in pids:
+        pids.remove(remove)
+    if created is not None:
+        data["created"] = created
+    data["pids"] = pids
+    raw = json.dumps(data).encode()
+    try:
+        os.lseek(lockfd, 0, os.SEEK_SET)
+        os.ftruncate(lockfd, 0)
+        os.write(lockfd, raw)
+    except OSError as err:
+        raise Exception("mwcan: users of the interface not writable: " + str(err))
+    return pids, data["created"]
+
+def mwcandiscover(caniface="can0", devpath="", window=0.3, loglevel=20, backend=CAN_BACKEND_SOCKETCAN):
+    dev = mwcan(DEV_BIC_2200, "00", devpath, loglevel, caniface, backend)
+    dev.can_up(identify=False)
+    try:
+        return dev.can_discover(window)
+    finally:
+        dev.can_down()
+
 #########################################
 ##class
 class mwcan:
@@ -231,7 +827,7 @@ class mwcan:
         if c == 2:                    print("CONFIG BIT  2-1: Pre-set is previous set value")    
         if c == 3:                    print("CONFIG BIT  2-1: not used, reserved")    
        
-        c = (val >> 7) & 0b00000011
+        c = (val >> SYSTEM_CONFIG_EEP_CONFIG) & 0b00000011
         if c == 0:                    print("CONFIG BIT  8-9: Immediate. Changes to parameters are written to EEPROM (default)")    
         if c == 1:                    print("CONFIG BIT  8-9: 1 minute delay. Write changes to EEPROM if all parameters remain unchanged for 1 minute")    
         if c == 2:                    print("CONFIG BIT  8-9: 10 minute delay. Write changes to EEPROM if all parameters remain unchanged for 10 minute")    
@@ -337,6 +933,7 @@ class mwcan:
 ##################################################################################################################################################
 
     def checkcandevice(self,val):
+        import ifcfg
         f = 0
         for name, interface in ifcfg.interfaces().items():
             # Check for Can0 interface
@@ -345,35 +942,22 @@ class mwcan:
                 f = 1
                 #can0 always found if slcand with RS232CAN is used, even when deleted
                 #workaround because of bug in ifcfg, check if up and running
-                logging.info("Found can0 interface. Check if already up ... ")
+                logging.info("Found " + val + " interface. Check if already up ... ")
                 if(interface['flags'] == "193<UP,RUNNING,NOARP> "):  
                     f = 2
-                    logging.info("Found can0 interface. Already created.")
+                    logging.info("Found " + val + " interface. Already created.")
         return f
 
-    def mwcaniniread(self,val):
+    def mwcaniniread(self,val,limits=None):
+        #limits: mwcan.ini values from the identity cache, mwcan.ini is not read then
         logging.debug("Detected Device: " + val)
         self.mwtype = val
-        config = configparser.ConfigParser()
-        config.sections()
-        spath = os.path.dirname(os.path.realpath(__file__)) 
-        logging.debug("Ini Path: " + spath + '/mwcan.ini')
-        config.read(spath + '/mwcan.ini')
-        if config.has_section(val): 
-            self.dev_Voltage             = int(config.get(val, 'Voltage'))
-            self.dev_MaxWatt             = int(config.get(val, 'MaxWatt'))
-            self.dev_BoostChargeVoltage  = round(float(config.get(val, 'BoostChargeVoltage'))*100)
-            self.dev_FloatChargeVoltage  = round(float(config.get(val, 'FloatChargeVoltage'))*100)
-            self.dev_MinChargeVoltage    = round(float(config.get(val, 'MinChargeVoltage'))*100)
-            self.dev_MaxChargeVoltage    = round(float(config.get(val, 'MaxChargeVoltage'))*100)
-            self.dev_MinChargeCurrent    = round(float(config.get(val, 'MinChargeCurrent'))*100)
-            self.dev_MaxChargeCurrent    = round(float(config.get(val, 'MaxChargeCurrent'))*100)
-
-            #BIC-2200 parameter
-            self.dev_MinDisChargeVoltage = round(float(config.get(val, 'MinDisChargeVoltage'))*100)
-            self.dev_MaxDisChargeVoltage = round(float(config.get(val, 'MaxDisChargeVoltage'))*100)
-            self.dev_MinDisChargeCurrent = round(float(config.get(val, 'MinDisChargeCurrent'))*100)
-            self.dev_MaxDisChargeCurrent = round(float(config.get(val, 'MaxDisChargeCurrent'))*100)
+        if limits is None:
+            limits = mwcaninilimits(val)
+        if limits is not None: 
+            #BIC-2200 only: MinDisChargeVoltage .. MaxDisChargeCurrent
+            for k, v in limits.items():
+                setattr(self, "dev_" + k, v)
 
             logging.info("Voltage:             " + str(self.dev_Voltage) + " V")
             logging.info("MaxWatt:             " + str(self.dev_MaxWatt) + " W")
@@ -393,136 +977,410 @@ class mwcan:
         else:
             return -1
 
-    def __init__(self, usedmwdev, mwcanid, devpath, loglevel):
-        logging.basicConfig(level=loglevel, encoding='utf-8')
+    def __init__(self, usedmwdev, mwcanid, devpath, loglevel, caniface="can0", backend=CAN_BACKEND_SOCKETCAN):
+        if not logging.getLogger().handlers: #application did not configure logging
+            logging.basicConfig(level=loglevel, encoding='utf-8')
         if devpath == "": devpath = "/dev/ttyACM0" #just try if is is the common devpath
         self.CAN_DEVICE    = devpath
+        self.CAN_IFACE     = caniface
+        self.CAN_BACKEND   = backend
+        self.CAN_BUSPACER  = mwcanbuspacer(caniface)
+        self.CAN_SHARED    = False #True if the python-can Bus is shared with another instance
+        self.CAN_TIMEOUT   = 0.5   #seconds to wait for a reply
+        self.CAN_OWNERSHIP = False #True = lock per command code between processes
+        self.CAN_USER      = False #True = our PID is in the users file of the interface
+        self.CAN_KEEPIFACE = False #True = never remove the interface at can_down (connect)
+        self.CAN_HOOK_PRE  = None
+        self.CAN_HOOK_POST = None
+        self.CAN_RECOVERY  = {"count": 0, "tier": 0, "time": 0.0, "resync": 0, "resync_fixed": 0}
+        self.CAN_DEVICES   = {} #prebuilt request frames, setpoints and pacer per device address
         
         self.can_set_ADR(usedmwdev, mwcanid)
       
         logging.debug("CAN device  : " + self.CAN_DEVICE)
+        logging.debug("CAN iface   : " + self.CAN_IFACE)
+        logging.debug("CAN backend : " + self.CAN_BACKEND)
         logging.debug("CAN adr to  : " + str(self.CAN_ADR))
         logging.debug("CAN adr from: " + self.CAN_ADR_R)
 
     def can_set_ADR(self,usedmwdev, mwcanid):
         self.USEDMWHW      = usedmwdev 
-        if usedmwdev==0: #BIC-2200 
-            CAN_ADR_S   = "0x000C03" + mwcanid
-            CAN_ADR_S_R = "000c02"   + mwcanid #return from CAN is lowercase
-        if usedmwdev==1: #NPB
-            CAN_ADR_S   = "0x000C01" + mwcanid
-            CAN_ADR_S_R = "000c00"   + mwcanid #return from CAN is lowercase
-
-        self.CAN_ADR   = int(CAN_ADR_S,16)
-        self.CAN_ADR_R = CAN_ADR_S_R           #need string to compare of return of CAN
+        CAN_ADR_S   = CAN_ADR_PREFIX[usedmwdev][0] + mwcanid
+        CAN_ADR_S_R = CAN_ADR_PREFIX[usedmwdev][1] + mwcanid #return from CAN is lowercase
+
+        self.CAN_GROUP  = None                  #list of addresses during group_write
+        self.CAN_PEERS  = []                    #other instances on the Bus during group_write
+        self.CAN_ADR    = int(CAN_ADR_S,16)
+        self.CAN_ADR_R  = CAN_ADR_S_R           #need string to compare of return of CAN
+        self.CAN_ADR_RI = int(CAN_ADR_S_R,16)   #same as int to compare with msg.arbitration_id
+
+        #read frames are keyed by command code, write frames by byte count (index 1 or 2)
+        #setpoints: last written value per (lobyte,hibyte) -> (val,count), for resync after can_restart
+        if self.CAN_ADR not in self.CAN_DEVICES:
+            self.CAN_DEVICES[self.CAN_ADR] = {"frames": {}, "wframes": [None, None, None], "setpoints": {},
+                                              "ids": (usedmwdev, mwcanid), "pacer": mwcanpacer(PACER_START_RATE),
+                                              "energy": mwcanenergy(), "stats": {}, "dropped": [0],
+                                              "eeprom": mwcaneeprom()}
+        d = self.CAN_DEVICES[self.CAN_ADR]
+        self.CAN_FRAMES    = d["frames"]
+        self.CAN_WFRAMES   = d["wframes"]
+        self.CAN_SETPOINTS = d["setpoints"]
+        self.CAN_PACER     = d["pacer"]
+        self.CAN_ENERGY    = d["energy"]
+        self.CAN_STATS     = d["stats"]   #command code -> mwcanstat
+        self.CAN_DROPPED   = d["dropped"] #[count]
+        self.CAN_EEPROM    = d["eeprom"]
         return
 
+    def can_frame_read(self,lobyte,hibyte):
+        #The read request for a command is always the same 2 bytes to the same CAN_ADR
+        #build it once and reuse it for every following request
+        cmd = (hibyte << 8) | lobyte
+        msg = self.CAN_FRAMES.get(cmd)
+        if msg is None:
+            import can
+            msg = can.Message(arbitration_id=self.CAN_ADR, data=[lobyte,hibyte], is_extended_id=True)
+            self.CAN_FRAMES[cmd] = msg
+        return msg
+
+    def can_frame_write(self,lobyte,hibyte,val,count):
+        #One reused write frame per byte count, data is updated in place
+        msg = self.CAN_WFRAMES[count]
+        if msg is None:
+            import can
+            msg = can.Message(arbitration_id=self.CAN_ADR, data=bytearray(2+count), is_extended_id=True)
+            self.CAN_WFRAMES[count] = msg
+        msg.arbitration_id = self.CAN_ADR #never keeps a group address
+        data = msg.data
+        data[0] = lobyte
+        data[1] = hibyte
+        data[2] = val & 0xFF
+        if count == 2:
+            data[3] = (val >> 8) & 0xFF
+        return msg
+
     #########################################
     # CAN function
-    def can_up(self,readini=True):
-        self.can0found = self.checkcandevice("can0") 
+    def can_up(self,readini=True,bus=None,identify=True):
+        #bus: already opened python-can Bus of another instance on the same interface
+        #     the bus and the interface are then left to the owner at can_down
+        #identify: False = do not read the device type, e.g. for can_discover
+        if bus is not None:
+            self.can0found = 2
+            self.CAN_SHARED = True
+        elif self.CAN_BACKEND == CAN_BACKEND_SLCAN:
+            self.can0found = 2 #no kernel interface to create or remove
+        else:
+            #no other process may create or remove the interface in between
+            lockfd = iface_lock(self.CAN_IFACE)
+            try:
+                self.can0found = self.checkcandevice(self.CAN_IFACE) 
         
-        if self.can0found < 2: #2 = fully up, #1 = created but not up, #0 = can0 not exists, mostly RS232 devices 
-            if self.can0found == 0: 
-                os.system('sudo slcand -f -s5 -o ' + self.CAN_DEVICE) #looks like a RS232 device, bring it up 
-                logging.debug("can_up: RS232 DEVICE ?")
+                if self.can0found < 2: #2 = fully up, #1 = created but not up, #0 = interface not exists, mostly RS232 devices 
+                    if self.can0found == 0: 
+                        os.system('sudo slcand -f -s5 -o ' + self.CAN_DEVICE + ' ' + self.CAN_IFACE) #looks like a RS232 device, bring it up 
+                        logging.debug("can_up: RS232 DEVICE ?")
+
+                    logging.debug("can_up: Link Set")
+                    os.system('sudo ip link set ' + self.CAN_IFACE + ' up type can bitrate ' + str(CAN_BITRATE))
+                    os.system('sudo ip link set up ' + self.CAN_IFACE + ' txqueuelen 1000')
 
-            logging.debug("can_up: Link Set")
-            os.system('sudo ip link set can0 up type can bitrate 250000')
-            os.system('sudo ip link set up can0 txqueuelen 1000')
+                pids, created = iface_users(lockfd, add=os.getpid(), created=True if self.can0found < 2 else None)
+                self.CAN_USER = True
+                logging.debug("can_up: " + self.CAN_IFACE + " used by " + str(len(pids)) + " processes")
+            finally:
+                iface_unlock(lockfd)
 
         # init interface for using with this class
-        logging.debug("can_up: init SocketCan")
-        self.can0 = can.interface.Bus(channel = 'can0', bustype = 'socketcan')
+        if bus is not None:
+            logging.debug("can_up: shared SocketCan " + self.CAN_IFACE)
+            self.can0 = bus
+        else:
+            self.can_open_bus()
         
+        if not identify:
+            return ""
+
         t = self.type_read().strip()
         if(readini==True):
             #Get Meanwell device and set parameter from mwcan.ini file
             if self.mwcaniniread(t) == -1:
                 raise Exception("MEANWELL DEVICE NOT FOUND")
+            identity_cache_write(self.identity_key(), t, mwcaninilimits(t))
         
         return t
+
+    def identity_key(self):
+        return self.CAN_IFACE + ":" + format(self.CAN_ADR, '#010x')
+
+    def connect(self,mwtype=""):
+        self.can0found = 2 #interface is not ours, can_down keeps it
+        self.CAN_KEEPIFACE = True
+        if self.CAN_BACKEND == CAN_BACKEND_SOCKETCAN:
+            lockfd = iface_lock(self.CAN_IFACE)
+            try:
+                iface_users(lockfd, add=os.getpid())
+                self.CAN_USER = True
+            finally:
+                iface_unlock(lockfd)
+        self.can_open_bus()
+
+        limits = None
+        if mwtype == "":
+            cached = identity_cache_read(self.identity_key())
+            if cached is not None:
+                mwtype = cached["type"]
+                limits = cached["limits"]
+                logging.debug("connect: cached device " + mwtype)
+        if mwtype == "":
+            mwtype = self.type_read().strip()
+        if self.mwcaniniread(mwtype, limits) == -1:
+            raise Exception("MEANWELL DEVICE NOT FOUND")
+        if limits is None:
+            identity_cache_write(self.identity_key(), mwtype, mwcaninilimits(mwtype))
+        return mwtype
         
     def can_down(self):
+        self.dynamic_leave_all()
+        if self.CAN_SHARED: #Bus and interface belong to another instance
+            logging.info("can_down: " + self.CAN_IFACE + " shared. Not removing it.")
+            return
+        for d in self.CAN_DEVICES.values():
+            d["energy"].save()
         self.can0.shutdown() #Shutdown our interface
-        if self.can0found < 2: #only shutdown system can0 if it was created by us
-            logging.info("can_down: shutdown CAN0")
-            os.system('sudo ip link set can0 down')
-            os.system('sudo ip link del can0')
-        else:
-            logging.info("can0 was externally created. Not removing it.")
+        if self.CAN_BACKEND == CAN_BACKEND_SLCAN:
+            logging.info("can_down: closed " + self.CAN_DEVICE)
+            return
+        if not self.CAN_USER:
+            return
+        try:
+            lockfd = iface_lock(self.CAN_IFACE)
+        except Exception as err:
+            logging.error("can_down: " + str(err) + ". Not removing " + self.CAN_IFACE)
+            return
+        try:
+            try:
+                pids, created = iface_users(lockfd, remove=os.getpid())
+            except Exception as err:
+                logging.error("can_down: " + str(err) + ". Not removing " + self.CAN_IFACE)
+                return
+            self.CAN_USER = False
+            if pids: #other processes still use it
+                logging.info("can_down: " + self.CAN_IFACE + " still used by " + str(len(pids)) + " processes. Not removing it.")
+            elif created and self.CAN_KEEPIFACE:
+                logging.info("can_down: " + self.CAN_IFACE + " used with connect(). Not removing it.")
+            elif created: #only shutdown system interface if it was created by mwcan
+                logging.info("can_down: shutdown " + self.CAN_IFACE)
+                os.system('sudo ip link set ' + self.CAN_IFACE + ' down')
+                os.system('sudo ip link del ' + self.CAN_IFACE)
+                iface_users(lockfd, created=False)
+            else:
+                logging.info(self.CAN_IFACE + " was externally created. Not removing it.")
+        finally:
+            iface_unlock(lockfd)
+
+    def can_discover(self,window=0.3):
+        import can
+        logging.debug("can_discover: scan all device IDs")
+        replies = {} #reply ID -> (usedmwdev, mwcanid)
+        frames  = []
+        for usedmwdev, ids in CAN_IDS.items():
+            prefix, prefix_r = CAN_ADR_PREFIX[usedmwdev]
+            for mwcanid in ids:
+                replies[int(prefix_r + mwcanid,16)] = (usedmwdev, mwcanid)
+                for lobyte in [0x82, 0x83]:
+                    frames.append(can.Message(arbitration_id=int(prefix + mwcanid,16), data=[lobyte,0x00], is_extended_id=True))
+        
+        for msg in frames:
+            self.CAN_BUSPACER.acquire()
+            self.can0.send(msg)
+
+        #collect type string parts by reply ID and command
+        parts = {}
+        end = time.monotonic() + window
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0: break
+            msg = self.can0.recv(remaining)
+            if msg is None: break
+            if msg.arbitration_id in replies and msg.dlc >= 2 and msg.data[1] == 0x00 and msg.data[0] in [0x82, 0x83]:
+                parts[(msg.arbitration_id, msg.data[0])] = msg.data[2:msg.dlc].decode(errors="ignore")
+
+        found = []
+        for adr_r, (usedmwdev, mwcanid) in replies.items():
+            if (adr_r, 0x82) not in parts: continue
+            model = (parts[(adr_r, 0x82)] + parts.get((adr_r, 0x83), "")).strip()
+            logging.info("can_discover: found " + model + " ID " + mwcanid)
+            found.append({"usedmwdev": usedmwdev, "mwcanid": mwcanid, "model": model, "limits": mwcaninilimits(model)})
+        return found
+
+    def can_open_bus(self):
+        import can
+        if self.CAN_BACKEND == CAN_BACKEND_SLCAN:
+            logging.debug("can_up: init slcan " + self.CAN_DEVICE)
+            self.can0 = can.interface.Bus(channel = self.CAN_DEVICE, bustype = 'slcan', bitrate = CAN_BITRATE, sleep_after_open = SLCAN_OPEN_SLEEP)
+            return
+        logging.debug("can_up: init SocketCan " + self.CAN_IFACE)
+        self.can0 = can.interface.Bus(channel = self.CAN_IFACE, bustype = 'socketcan')
+
+    def can_alive(self):
+        #device answers the operation read ?
+        return self.can_read_multi([(0x00,0x00)])[(0x00,0x00)] != -1
+
+    def can_reopen(self):
+        logging.info("can_restart: reopen bus " + self.CAN_IFACE)
+        try:
+            self.can0.shutdown()
+        except Exception as err:
+            logging.debug("can_restart: shutdown " + str(err))
+        try:
+            self.can_open_bus()
+        except Exception as err:
+            logging.error("can_restart: open bus " + str(err))
+            return False
+        return self.can_alive()
+
+    def can_link_restart(self):
+        if self.CAN_BACKEND == CAN_BACKEND_SLCAN:
+            return #no kernel link, reopening the serial port is all we can do
+        logging.info("can_restart: restart link " + self.CAN_IFACE)
+        if self.checkcandevice(self.CAN_IFACE) == 0:
+            return #no interface, only tier 3 can help
+        os.system('sudo ip link set ' + self.CAN_IFACE + ' down')
+        os.system('sudo ip link set ' + self.CAN_IFACE + ' up type can bitrate ' + str(CAN_BITRATE))
+
+    def can_resync(self):
+        #read back all cached setpoints of all devices pipelined, write again if different
+        checked = 0
+        fixed   = 0
+        adr = self.CAN_DEVICES[self.CAN_ADR]["ids"]
+        try:
+            for d in list(self.CAN_DEVICES.values()):
+                setpoints = d["setpoints"]
+                if not setpoints: continue
+                self.can_set_ADR(*d["ids"])
+                values = self.can_read_multi(list(setpoints))
+                for (lobyte,hibyte), (val,count) in list(setpoints.items()):
+                    checked += 1
+                    if values[(lobyte,hibyte)] != val:
+                        logging.warning("can_restart: resync " + hex(self.CAN_ADR) + " " + hex((hibyte << 8) | lobyte) + " " + str(values[(lobyte,hibyte)]) + " -> " + str(val))
+                        self.can_read_write(lobyte,hibyte,1,val,count)
+                        fixed += 1
+        finally:
+            self.can_set_ADR(*adr) #also after a send error, the next request goes to our unit
+        return checked, fixed
 
     def can_restart(self):
         #In case of critical error and bus can not resume, restart the bus
+        if self.CAN_SHARED: #the bus belongs to another instance, never close it here
+            logging.error("can_restart: bus of " + self.CAN_IFACE + " is shared. Restart its owner.")
+            return 0
         logging.info("can_restart bus")
-        self.can_down()
-        self.can_up(False)
+        t = time.monotonic()
+        tier = 1
+        if not self.can_reopen():
+            tier = 2
+            self.can_link_restart()
+            if not self.can_reopen():
+                tier = 3
+                self.can_down()
+                self.can_up(False)
+        checked, fixed = self.can_resync()
+        t = time.monotonic() - t
+        self.CAN_RECOVERY["count"]       += 1
+        self.CAN_RECOVERY["tier"]         = tier
+        self.CAN_RECOVERY["time"]         = t
+        self.CAN_RECOVERY["resync"]       = checked
+        self.CAN_RECOVERY["resync_fixed"] = fixed
+        logging.info("can_restart: tier " + str(tier) + " in " + str(round(t*1000)) + " ms, " + str(fixed) + " of " + str(checked) + " setpoints written again")
+        return tier
 
     #########################################
     # receive function
-    def can_receive(self):
-        msgr = str(self.can0.recv(0.5))
-        logging.debug("CAN RECEIVE: " + msgr)
-        if msgr != "None":
-            msgr_split = msgr.split()
-            #Check if the CAN response is from our request
-            if msgr_split[3] != self.CAN_ADR_R:
-                return -1
-            
-            if msgr_split[7] == "3":
-                hexval = (msgr_split[10])
-                decval = int(hexval,8)
-            
-            if msgr_split[7] == "4":
-                hexval = (msgr_split[11] + msgr_split[10])
-                decval = int(hexval,16)
-            
-            #special format for scaling factor and frimware version
-            if msgr_split[7] == "8":
-                if(msgr_split[8] == "84"): #Firmware
-                    i=10
-                    hexarray = ""
-                    while(msgr_split[i]) != "ff":
-                        hexarray = hexarray + msgr_split[i] 
-                        i+=1
-
-                    hexval = bytearray.fromhex(hexarray) #Currently only 2 Bytes
-                    decval = int(hexval.hex(),16)
-                    hexval = hexval.hex() 
-
-                if(msgr_split[8] == "c0"): #Scaling Factor
-                    hexval = bytearray.fromhex(msgr_split[15]+msgr_split[14]+msgr_split[13]+msgr_split[12]+msgr_split[11]+msgr_split[10])
-                    decval = int(hexval.hex(),16)
-                    hexval = hexval.hex() 
-
-            logging.debug("Return HEX: " + hexval)
+    def can_decode(self,msg):
+        #decode the value of a reply frame, data[0..1] is the command code
+        data = msg.data
+        dlc  = msg.dlc
+        decval = -1
+        if dlc == 3:
+            decval = data[2]
+        
+        if dlc == 4:
+            decval = data[2] | (data[3] << 8)
+        
+        #special format for scaling factor and frimware version
+        if dlc == 8:
+            if data[0] == 0x84: #Firmware
+                decval = 0
+                i = 2
+                while i < 8 and data[i] != 0xFF: #Currently only 2 Bytes
+                    decval = (decval << 8) | data[i]
+                    i+=1
+
+            if data[0] == 0xC0: #Scaling Factor
+                decval = int.from_bytes(data[2:8],'little')
+
+        #dc voltage / current --> energy counters
+        if data[1] == 0x00 and dlc == 4 and (data[0] == 0x60 or data[0] == 0x61):
+            t = msg.timestamp or time.time()
+            if data[0] == 0x60: self.CAN_ENERGY.update(decval, None, t)
+            else:               self.CAN_ENERGY.update(None, self.i_out_signed(decval), t)
+
+        self.can_stat_reply(msg,decval)
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Return HEX: " + format(decval, 'x'))
             logging.debug("Return DEC: " + str(decval))
             logging.debug("Return BIN: " + format(decval, '#018b'))
+        return decval
+
+    def can_receive_msg(self,lobyte=None,hibyte=None):
+        #wait for the reply of our request within CAN_TIMEOUT
+        #frames of other devices and late replies to other commands are skipped
+        end = time.monotonic() + self.CAN_TIMEOUT
+        remaining = self.CAN_TIMEOUT
+        while remaining > 0:
+            msg = self.can0.recv(remaining)
+            logging.debug("CAN RECEIVE: %s", msg)
+            if msg is None:
+                return None
+            #Check if the CAN response is from our request
+            if msg.arbitration_id == self.CAN_ADR_RI and (lobyte is None or (msg.dlc >= 2 and msg.data[0] == lobyte and msg.data[1] == hibyte)):
+                if not self.CAN_OWNERSHIP or lobyte is None or msg.timestamp >= self.can_stat(lobyte,hibyte).sent:
+                    return msg
+            self.CAN_DROPPED[0] += 1
+            remaining = end - time.monotonic()
+        return None
+
+    def can_receive(self,lobyte=None,hibyte=None):
+        msg = self.can_receive_msg(lobyte,hibyte)
+        if msg is not None:
+            self.CAN_PACER.success()
+            decval = self.can_decode(msg)
             
         else: 
             logging.error("ERROR: TIMEOUT - NO MESSAGE RETURNED ! CHECK SETTINGS OR MESSAGE TYPE NOT SUPPORTED !")
+            self.CAN_PACER.timeout([(lobyte,hibyte)])
+            self.can_stat_timeout(lobyte,hibyte)
             decval = -1
 
         return decval
     
-    def can_receive_char(self):
-        msgr = str(self.can0.recv(0.5))
-        logging.debug(msgr)
-        if msgr != "None":
-            msgr_split = msgr.split()
-            #Check if the CAN response is from our request
-            if msgr_split[3] != self.CAN_ADR_R:
-                return ""
-            
-            if msgr_split[7] == "5":
-                s = bytearray.fromhex(msgr_split[10]+msgr_split[11]+msgr_split[12]).decode()
+    def can_receive_char(self,lobyte=None,hibyte=None):
+        msg = self.can_receive_msg(lobyte,hibyte)
+        if msg is not None:
+            s = ""
+            if msg.dlc == 5:
+                s = msg.data[2:5].decode()
 
-            if msgr_split[7] == "8":
-                s = bytearray.fromhex(msgr_split[10]+msgr_split[11]+msgr_split[12]+msgr_split[13]+msgr_split[14]+msgr_split[15]).decode()
+            if msg.dlc == 8:
+                s = msg.data[2:8].decode()
             logging.debug(s)
+            self.can_stat_reply(msg,s)
 
         else:
             logging.error('Timeout occurred, no message.')
+            self.can_stat_timeout(lobyte,hibyte)
             s = ""
 
         return s
@@ -530,36 +1388,242 @@ class mwcan:
     #############################################################################
     # Read Write operation function
     def can_read_write(self,lobyte,hibyte,rw,val,count=2):
+        #before the frame is built, leaving the mode reuses the same write frames
+        if self.CAN_EEPROM.active and self.CAN_EEPROM.expired(time.monotonic()):
+            self.dynamic_leave()
         if rw==0:
             logging.debug("can_read_write -> READ")
-            msg = can.Message(arbitration_id=self.CAN_ADR, data=[lobyte,hibyte], is_extended_id=True)
-            self.can0.send(msg)
-            v = self.can_receive()
+            own = self.can_own([(lobyte,hibyte)])
+            try:
+                self.can_send(self.can_frame_read(lobyte,hibyte))
+                v = self.can_receive(lobyte,hibyte)
+            finally:
+                self.can_release(own)
         else:
             logging.debug("can_read_write -> WRITE")
-            valhighbyte = val >> 8
-            vallowbyte  = val & 0xFF
-            if count == 1: #1 byte to send
-                msg = can.Message(arbitration_id=self.CAN_ADR, data=[lobyte,hibyte,vallowbyte], is_extended_id=True)
-            if count == 2: #2 byte to send
-                msg = can.Message(arbitration_id=self.CAN_ADR, data=[lobyte,hibyte,vallowbyte,valhighbyte], is_extended_id=True)
-            self.can0.send(msg)
+            msg = self.can_frame_write(lobyte,hibyte,val,count)
+            if self.CAN_GROUP is None:
+                self.can_send(msg)
+                self.can_written(lobyte,hibyte,val,count)
+            else:
+                #own frame for the group, the reused frame of this device keeps its address
+                #same data to every unit of the group, no waiting in between
+                import can
+                gmsg = can.Message(arbitration_id=self.CAN_ADR, data=bytearray(msg.data), is_extended_id=True)
+                for adr in self.CAN_GROUP:
+                    gmsg.arbitration_id = adr
+                    self.CAN_BUSPACER.acquire()
+                    self.can0.send(gmsg)
+                self.group_record(lobyte,hibyte,val,count)
             v = val
 
         return v
+
+    def can_written(self,lobyte,hibyte,val,count):
+        #setpoint cache and EEPROM write count of the current device
+        self.CAN_SETPOINTS[(lobyte,hibyte)] = (val,count)
+        eep = self.CAN_EEPROM
+        if eep.mode != DYNAMIC_OFF and not eep.busy and (lobyte,hibyte) != (0xC2,0x00):
+            if eep.write((lobyte,hibyte), time.monotonic()):
+                self.dynamic_enter()
     
-    def can_read_string(self,lobyte,hibyte,lobyte2,hibyte2):
+    def can_read_multi(self,cmds,timeout=None):
+        #pipelined read: send all requests back to back, then collect the replies
+        #cmds = [(lobyte,hibyte), ...], replies are matched by the command code in data[0..1]
+        #returns {(lobyte,hibyte): value}, value -1 if no reply within timeout
+        #values are raw, e.g. no negative current handling of i_out_read
+        logging.debug("can_read_multi -> READ " + str(len(cmds)))
+        if self.CAN_EEPROM.active and self.CAN_EEPROM.expired(time.monotonic()):
+            self.dynamic_leave()
+        own = self.can_own(cmds)
+        try:
+            for lobyte,hibyte in cmds:
+                self.can_send(self.can_frame_read(lobyte,hibyte))
+
+            result  = dict.fromkeys(cmds, -1)
+            pending = set(cmds)
+            if timeout is None: timeout = self.CAN_TIMEOUT
+            end = time.monotonic() + timeout
+            while pending:
+                remaining = end - time.monotonic()
+                if remaining <= 0: break
+                msg = self.can0.recv(remaining)
+                if msg is None: break
+                if msg.arbitration_id != self.CAN_ADR_RI or msg.dlc < 2:
+                    self.CAN_DROPPED[0] += 1
+                    continue
+                key = (msg.data[0], msg.data[1])
+                if key in pending and self.CAN_OWNERSHIP and msg.timestamp < self.can_stat(*key).sent:
+                    self.CAN_DROPPED[0] += 1 #reply to a request of another process
+                    continue
+                if key in pending:
+                    self.CAN_PACER.success()
+                    result[key] = self.can_decode(msg)
+                    pending.discard(key)
+                else:
+                    self.CAN_DROPPED[0] += 1
+
+            if pending:
+                logging.error("ERROR: TIMEOUT - NO MESSAGE RETURNED FOR " + str(len(pending)) + " PIPELINED READS !")
+                self.CAN_PACER.timeout(pending)
+                for lobyte,hibyte in pending:
+                    self.can_stat_timeout(lobyte,hibyte)
+            return result
+        finally:
+            self.can_release(own)
 
-        msg = can.Message(arbitration_id=self.CAN_ADR, data=[lobyte,hibyte], is_extended_id=True)
+    #########################################
+    # request ownership between processes
+    def can_own(self,cmds):
+        #lock device address + command code of all cmds, sorted, so there is no deadlock
+        if not self.CAN_OWNERSHIP or self.CAN_BACKEND != CAN_BACKEND_SOCKETCAN: return None
+        import fcntl
+        fd = lock_file(self.CAN_IFACE, "cmd")
+        keys = sorted(set(((self.CAN_ADR & 0xFFFF) << 16) | (hibyte << 8) | lobyte for lobyte,hibyte in cmds))
+        for k in keys:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, k)
+        return keys
+
+    def can_release(self,keys):
+        if keys is None: return
+        import fcntl
+        fd = lock_file(self.CAN_IFACE, "cmd")
+        for k in keys:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, k)
+
+    def can_send(self,msg):
+        #paced send, device bucket first (reads only), then the bucket of the interface
+        if msg.dlc == 2:
+            self.CAN_PACER.acquire()
+        self.CAN_BUSPACER.acquire()
+        st = self.can_stat(msg.data[0],msg.data[1])
+        st.requests += 1
+        st.tx_bytes += msg.dlc
+        if self.CAN_HOOK_PRE is not None:
+            self.CAN_HOOK_PRE(self, (msg.data[1] << 8) | msg.data[0], msg)
+        st.sent = time.time()
         self.can0.send(msg)
-        s1 = ""
-        s1 = self.can_receive_char()
+
+    #########################################
+    # statistics
+    def can_stat(self,lobyte,hibyte):
+        cmd = (hibyte << 8) | lobyte
+        st = self.CAN_STATS.get(cmd)
+        if st is None:
+            st = mwcanstat()
+            self.CAN_STATS[cmd] = st
+        return st
+
+    def can_stat_reply(self,msg,value):
+        st = self.can_stat(msg.data[0],msg.data[1])
+        st.replies += 1
+        st.rx_bytes += msg.dlc
+        latency = (msg.timestamp or time.time()) - st.sent
+        if st.sent > 0 and latency >= 0:
+            st.latency(latency)
+        if self.CAN_HOOK_POST is not None:
+            self.CAN_HOOK_POST(self, (msg.data[1] << 8) | msg.data[0], value, latency)
+
+    def can_stat_timeout(self,lobyte,hibyte):
+        if lobyte is None: return
+        self.can_stat(lobyte,hibyte).timeouts += 1
+        if self.CAN_HOOK_POST is not None:
+            self.CAN_HOOK_POST(self, (hibyte << 8) | lobyte, -1, None)
+
+    def stats(self):
+        result = {}
+        for adr, d in self.CAN_DEVICES.items():
+            result[format(adr, '#010x')] = {"dropped": d["dropped"][0],
+                                            "commands": {format(cmd, '#06x'): st.result() for cmd, st in sorted(d["stats"].items())}}
+        return result
+
+    def stats_reset(self):
+        for d in self.CAN_DEVICES.values():
+            d["stats"].clear()
+            d["dropped"][0] = 0
+
+    def tx_rate(self):
+        return {"device": self.CAN_PACER.rate, "bus": self.CAN_BUSPACER.rate}
+
+    def can_probe_rate(self,count=20,lobyte=0x60,hibyte=0x00):
+        #send count reads at rising rates, keep the highest rate without drops
+        logging.info("can_probe_rate: " + hex(self.CAN_ADR))
+        pacer = self.CAN_PACER
+        msg = self.can_frame_read(lobyte,hibyte)
+        best = PACER_MIN_RATE
+        rate = PACER_MIN_RATE * 2
+        while rate <= PACER_MAX_RATE:
+            pacer.rate = rate
+            for i in range(count):
+                self.can_send(msg)
+            got = 0
+            end = time.monotonic() + self.CAN_TIMEOUT
+            while got < count:
+                remaining = end - time.monotonic()
+                if remaining <= 0: break
+                r = self.can0.recv(remaining)
+                if r is None: break
+                if r.arbitration_id == self.CAN_ADR_RI and r.dlc >= 2 and r.data[0] == lobyte and r.data[1] == hibyte:
+                    got += 1
+            logging.debug("can_probe_rate: " + str(rate) + " req/s " + str(got) + "/" + str(count))
+            if got < count: break
+            best = rate
+            rate *= 2
+        pacer.rate = best * 0.8 if best > PACER_MIN_RATE else PACER_MIN_RATE
+        logging.info("can_probe_rate: " + str(round(pacer.rate)) + " req/s")
+        return pacer.rate
+
+    def group_write(self,setfunc,val,ids=None,peers=None):
+        if ids is None:
+            ids = [CAN_BROADCAST_ID]
+        logging.debug("group_write to " + str(ids))
+        prefix = CAN_ADR_PREFIX[self.USEDMWHW][0]
+        self.CAN_GROUP = [int(prefix + mwcanid,16) for mwcanid in ids]
+        self.CAN_PEERS = [] if peers is None else peers
+        try:
+            return setfunc(1,val)
+        finally:
+            self.CAN_GROUP = None
+            self.CAN_PEERS = []
+
+    def group_addressed(self,adr):
+        #device address reached by one of the group frames ?
+        return any(a == adr or (a & 0xFF == int(CAN_BROADCAST_ID,16) and a >> 8 == adr >> 8) for a in self.CAN_GROUP)
+
+    def group_record(self,lobyte,hibyte,val,count):
+        #cache the setpoint and count the EEPROM write of every unit the group frames reached
+        group = self.CAN_GROUP
+        peers = self.CAN_PEERS
+        ids   = self.CAN_DEVICES[self.CAN_ADR]["ids"]
+        units = [d["ids"] for adr, d in self.CAN_DEVICES.items() if self.group_addressed(adr)]
+        for adr in group:
+            if adr & 0xFF != int(CAN_BROADCAST_ID,16) and adr not in self.CAN_DEVICES:
+                units.append((self.USEDMWHW, format(adr & 0xFF, '02X')))
+        try:
+            for unit in units:
+                self.can_set_ADR(*unit) #CAN_GROUP is None now, dynamic_enter writes only this unit
+                self.can_written(lobyte,hibyte,val,count)
+        finally:
+            self.can_set_ADR(*ids) #also if dynamic_enter failed
+            self.CAN_GROUP = group
+            self.CAN_PEERS = peers
+        for peer in peers:
+            if self.group_addressed(peer.CAN_ADR):
+                peer.can_written(lobyte,hibyte,val,count)
+
+    def can_read_string(self,lobyte,hibyte,lobyte2,hibyte2):
+        own = self.can_own([(lobyte,hibyte)] + ([(lobyte2,hibyte2)] if lobyte2 > 0 or hibyte2 > 0 else []))
+        try:
+            self.can_send(self.can_frame_read(lobyte,hibyte))
+            s1 = ""
+            s1 = self.can_receive_char(lobyte,hibyte)
     
-        s2 = ""
-        if (lobyte2 > 0) or (hibyte2 > 0):
-            msg = can.Message(arbitration_id=self.CAN_ADR, data=[lobyte2,hibyte2], is_extended_id=True)
-            self.can0.send(msg)
-            s2 = self.can_receive_char()
+            s2 = ""
+            if (lobyte2 > 0) or (hibyte2 > 0):
+                self.can_send(self.can_frame_read(lobyte2,hibyte2))
+                s2 = self.can_receive_char(lobyte2,hibyte2)
+        finally:
+            self.can_release(own)
         
         s=s1+s2
         logging.info("Received String: " + s)
@@ -620,10 +1684,23 @@ class mwcan:
         # Command Code 0x0061
         # Read DC Current
         v = self.can_read_write(0x61,0x00,0,0)
+        return(self.i_out_signed(v))
+
+    def energy_read(self):
+        return dict(self.CAN_ENERGY.counters)
+
+    def energy_persist(self,path):
+        self.CAN_ENERGY.persist(path)
+
+    def energy_reset(self):
+        self.CAN_ENERGY.reset()
+        self.CAN_ENERGY.save()
+
+    def i_out_signed(self,v):
         #BIC-2200 return negative current with 
         if self.USEDMWHW in [0]:
              if v > 20000: v = v - 65536
-        return(v)
+        return v
    
     def temp_read(self):
         logging.debug("read power supply temperature (format: value, F=0.10) 0x0062")
@@ -688,6 +1765,75 @@ class mwcan:
         # Read/Write system config 
         return self.can_read_write(0xC2,0x00,rw,val)
 
+    #########################################
+    # dynamic control mode
+    def dynamic_control(self,mode=DYNAMIC_EEP_OFF,delay=EEP_CONFIG_1MIN,enter=DYNAMIC_ENTER_WRITES,idle=DYNAMIC_EXIT_IDLE):
+        eep = self.CAN_EEPROM
+        if eep.active and (mode != eep.mode or delay != eep.delay):
+            self.dynamic_leave()
+        eep.mode  = mode
+        eep.delay = delay
+        eep.enter = enter
+        eep.idle  = idle
+        eep.times = []
+
+    def dynamic_state(self):
+        return self.CAN_EEPROM.result()
+
+    def dynamic_enter(self):
+        eep = self.CAN_EEPROM
+        eep.busy = True
+        try:
+            val = self.system_config(0,0)
+            if val == -1:
+                logging.warning("dynamic control: " + hex(self.CAN_ADR) + " system config not read, mode not entered")
+                eep.times = []
+                return
+            eep.saved = val
+            new = eep.config(val)
+            if new != val:
+                self.system_config(1,new)
+            eep.active  = True
+            eep.pending = set()
+            eep.counters["enter"] += 1
+            logging.info("dynamic control: " + hex(self.CAN_ADR) + " enter, system config " + hex(val) + " -> " + hex(new))
+        finally:
+            eep.busy = False
+
+    def dynamic_leave(self):
+        eep = self.CAN_EEPROM
+        if not eep.active: return
+        eep.busy = True
+        try:
+            new = eep.config(eep.saved)
+            if new != eep.saved:
+                self.system_config(1,eep.saved)
+            #last values again, now they are saved
+            for lobyte,hibyte in eep.pending:
+                val, count = self.CAN_SETPOINTS[(lobyte,hibyte)]
+                self.can_read_write(lobyte,hibyte,1,val,count)
+            eep.counters["commits"] += len(eep.pending)
+            logging.info("dynamic control: " + hex(self.CAN_ADR) + " leave, system config " + hex(eep.saved)
+                         + ", " + str(len(eep.pending)) + " parameters saved, " + str(eep.counters["avoided"]) + " EEPROM writes avoided")
+            eep.active  = False
+            eep.pending = set()
+            eep.times   = []
+            eep.counters["exit"] += 1
+        finally:
+            eep.busy = False
+
+    def dynamic_leave_all(self):
+        active = [d["ids"] for d in self.CAN_DEVICES.values() if d["eeprom"].active]
+        if not active: return
+        ids = self.CAN_DEVICES[self.CAN_ADR]["ids"]
+        for usedmwdev, mwcanid in active:
+            self.can_set_ADR(usedmwdev, mwcanid)
+            try:
+                self.dynamic_leave()
+            except Exception as err:
+                logging.error("dynamic control: leave " + hex(self.CAN_ADR) + " " + str(err))
+        self.can_set_ADR(*ids)
+
     #############################################################################
     ##NPB-abc0 only: Charger functions
     #############################################################################
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+# Benchmarks for the mwcan lib
+# Most benchmarks run without hardware against a fake bus which answers
+# every request with a prebuilt reply, so only the lib itself is measured.
+
+# Requirement for using
+# Needed external python modules
+# pip3 install python-can ifcfg
+
+# agent 19.10.2026  Version 0.1.0: Allocation / GC benchmark of the read path
+# agent 19.10.2026  Version 0.1.1: Import time and connect startup benchmark with budget check
+# agent 19.10.2026  Version 0.1.2: socketcan against direct slcan backend, startup and round trip (hardware needed)
+
+import gc
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import can
+import mwcan as mwcanmod
+from mwcan import *
+
+READS = 10000
+ROUNDTRIPS = 200
+
+# cold start budget, exit code 1 if exceeded
+IMPORT_BUDGET_MS  = 50
+CONNECT_BUDGET_MS = 5
+IMPORT_RUNS       = 10
+# must not be loaded by "import mwcan"
+LAZY_MODULES      = ["can", "ifcfg", "configparser", "json"]
+
+#########################################
+# fake bus, no hardware needed
+class fakebus:
+    def __init__(self, reply):
+        self.reply = reply
+
+    def send(self, msg):
+        pass
+
+    def recv(self, timeout=None):
+        return self.reply
+
+    def shutdown(self):
+        pass
+
+class simbus(fakebus):
+    #answers with the command code of the request and a type string for 0x0082 / 0x0083
+    def __init__(self, adr_r):
+        self.adr_r = adr_r
+        self.reply = None
+
+    def send(self, msg):
+        data = bytes(msg.data[:2])
+        if   data == b'\x82\x00': data += b'BIC-22'
+        elif data == b'\x83\x00': data += b'00-24 '
+        else:                      data += b'\xc4\x09'
+        self.reply = can.Message(arbitration_id=self.adr_r, data=data, is_extended_id=True)
+
+    def recv(self, timeout=None):
+        reply, self.reply = self.reply, None
+        return reply
+
+def fakedev():
+    dev = mwcan(DEV_BIC_2200, "00", "", 30)
+    #no pacing, measure the lib only
+    dev.CAN_PACER.rate = 0
+    dev.CAN_BUSPACER.rate = 0
+    #reply to 0x0060 v_out_read, 25.00V
+    dev.can0 = fakebus(can.Message(arbitration_id=dev.CAN_ADR_RI, data=[0x60,0x00,0xC4,0x09], is_extended_id=True))
+    return dev
+
+#########################################
+# benchmarks
+def bench_alloc():
+    print("Allocation / GC per " + str(READS) + " reads")
+    dev = fakedev()
+    dev.v_out_read()     #warm up, builds the request frame
+    dev.can_read_write(0x30,0x00,1,500) #warm up, builds the write frame
+
+    gccount = [0]
+    def gccb(phase, info):
+        if phase == "start": gccount[0] += 1
+
+    for name, func in [("read ", dev.v_out_read), ("write", lambda: dev.can_read_write(0x30,0x00,1,500))]:
+        gc.collect()
+        gccount[0] = 0
+        gc.callbacks.append(gccb)
+        tracemalloc.start()
+        snap1 = tracemalloc.take_snapshot()
+        t = time.perf_counter()
+        for i in range(READS):
+            func()
+        t = time.perf_counter() - t
+        snap2 = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        gc.callbacks.remove(gccb)
+
+        filt = [tracemalloc.Filter(True, "*mwcan.py")]
+        diff = snap2.filter_traces(filt).compare_to(snap1.filter_traces(filt), "filename")
+        blocks = sum(d.count_diff for d in diff)
+        print("  " + name + ": " + str(round(t / READS * 1e6, 2)) + " us/req, "
+              + "net blocks mwcan.py: " + str(blocks) + ", "
+              + "peak traced: " + str(peak) + " B, "
+              + "gc runs: " + str(gccount[0]))
+
+def bench_import():
+    print("Import time of mwcan, " + str(IMPORT_RUNS) + " fresh interpreters")
+    code = ("import sys, time; t = time.perf_counter(); import mwcan; t = time.perf_counter() - t; "
+            "print(t * 1000, ','.join(m for m in " + repr(LAZY_MODULES) + " if m in sys.modules))")
+    spath = os.path.dirname(os.path.realpath(__file__))
+    times = []
+    loaded = ""
+    for i in range(IMPORT_RUNS):
+        out = subprocess.run([sys.executable, "-c", code], cwd=spath, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(out[0]))
+        if len(out) > 1: loaded = out[1]
+    times.sort()
+    median = times[len(times) // 2]
+    print("  import mwcan: median " + str(round(median, 2)) + " ms, min " + str(round(times[0], 2)) + " ms (budget " + str(IMPORT_BUDGET_MS) + " ms)")
+    ok = median <= IMPORT_BUDGET_MS
+    if loaded:
+        print("  FAIL: loaded at import: " + loaded)
+        ok = False
+    return ok
+
+def bench_connect():
+    print("Startup connect() with fake bus")
+    mwcanmod.IDENTITY_CACHE = "/tmp/mwcanbench_identity.json"
+    if os.path.exists(mwcanmod.IDENTITY_CACHE): os.remove(mwcanmod.IDENTITY_CACHE)
+
+    def newdev():
+        dev = mwcan(DEV_BIC_2200, "00", "", 30)
+        dev.CAN_PACER.rate = 0
+        dev.CAN_BUSPACER.rate = 0
+        dev.can_open_bus = lambda: setattr(dev, "can0", simbus(dev.CAN_ADR_RI))
+        return dev
+
+    ok = True
+    for name in ["first (type read) ", "cached identity   "]:
+        t = time.perf_counter()
+        dev = newdev()
+        mwtype = dev.connect()
+        t = (time.perf_counter() - t) * 1000
+        print("  " + name + ": " + str(round(t, 3)) + " ms, " + mwtype)
+    if t > CONNECT_BUDGET_MS:
+        print("  FAIL: cached connect over budget " + str(CONNECT_BUDGET_MS) + " ms")
+        ok = False
+    os.remove(mwcanmod.IDENTITY_CACHE)
+    return ok
+
+def bench_backend(usedmwdev, mwcanid, devpath, caniface):
+    #socketcan first, can_down removes the interface again if can_up created it,
+    #then the serial port is free for the slcan backend
+    print("Backend startup and round trip, " + str(ROUNDTRIPS) + " v_out_read, device " + str(usedmwdev) + " ID " + mwcanid)
+    for backend in [CAN_BACKEND_SOCKETCAN, CAN_BACKEND_SLCAN]:
+        dev = mwcan(usedmwdev, mwcanid, devpath, 30, caniface, backend)
+        t = time.perf_counter()
+        try:
+            mwtype = dev.can_up()
+        except Exception as err:
+            print("  " + backend + ": can_up failed " + str(err))
+            continue
+        startup = time.perf_counter() - t
+
+        dev.CAN_PACER.rate = 0
+        dev.CAN_BUSPACER.rate = 0
+        lat = []
+        for i in range(ROUNDTRIPS):
+            t = time.perf_counter()
+            dev.v_out_read()
+            lat.append(time.perf_counter() - t)
+        lat.sort()
+        timeouts = dev.stats()[format(dev.CAN_ADR, '#010x')]["commands"]["0x0060"]["timeouts"]
+        external = dev.can0found == 2 and backend == CAN_BACKEND_SOCKETCAN and dev.checkcandevice(caniface) == 2
+        dev.can_down()
+
+        print("  " + backend.ljust(9) + ": " + mwtype + ", can_up " + str(round(startup * 1000, 1)) + " ms, "
+              + "round trip p50 " + str(round(lat[len(lat) // 2] * 1000, 2)) + " ms, "
+              + "p99 " + str(round(lat[len(lat) * 99 // 100] * 1000, 2)) + " ms, "
+              + "timeouts " + str(timeouts))
+        if external:
+            print("  " + caniface + " was created outside, the adapter is busy, slcan skipped")
+            break
+
+def bench_commands():
+    print("")
+    print(" " + sys.argv[0] + " - mwcan lib benchmarks")
+    print("")
+    print("       alloc                   -- allocations and gc runs per " + str(READS) + " reads/writes")
+    print("       import                  -- import time of mwcan and lazy import check, exit 1 if over budget")
+    print("       connect                 -- startup time of connect(), exit 1 if over budget")
+    print("       backend <usedmwdev> <id> [devpath] [caniface]")
+    print("                               -- socketcan against slcan, can_up time and round trip (hardware)")
+    print("")
+
+#### Main
+if len(sys.argv) == 1:
+    bench_commands()
+    sys.exit(1)
+
+if   sys.argv[1] in ['alloc']:   bench_alloc()
+elif sys.argv[1] in ['import']:  sys.exit(0 if bench_import() else 1)
+elif sys.argv[1] in ['connect']: sys.exit(0 if bench_connect() else 1)
+elif sys.argv[1] in ['backend'] and len(sys.argv) > 3:
+    bench_backend(int(sys.argv[2]), sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else "", sys.argv[5] if len(sys.argv) > 5 else "can0")
+else:
+    print("Unknown first argument '" + sys.argv[1] + "'")
+    bench_commands()
+    sys.exit(1)
+
+sys.exit(0)
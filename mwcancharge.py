@@ -0,0 +1,192 @@
+############################################################################
+#    This lib is free software; you can redistribute it and/or modify      #
+#    it under the terms of the LGPL                                        #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+############################################################################
+
+# Charge stages (CC / CV / float) for the BIC-2200, the NPB has them in hardware
+# Use at your own risk !
+
+# Version history
+# agent 19.10.2026  Version 0.1.0: Charge stage state machine with tapering, writes only on changes
+# agent 19.10.2026  Version 0.1.1: poll holds the stage if voltage / current were not read
+
+import logging
+import threading
+import time
+from mwcan import *
+from mwcanstate import *
+
+######################################################################################
+# Explanations
+######################################################################################
+
+######################################################################################
+# chg = mwcancharge(candev, boost=None, floatv=None, cc=None, tail=None, state=None)
+#
+# candev  = BIC-2200 (can_up done, ini values read, SYSTEM_CONFIG CAN control on)
+# boost   = absorption voltage V (0.01), default dev_BoostChargeVoltage of mwcan.ini
+# floatv  = float voltage V (0.01), default dev_FloatChargeVoltage of mwcan.ini
+#           The BIC-2200 entries in mwcan.ini are 0, then boost / floatv must be given
+# cc      = charge current A (0.01), default dev_MaxChargeCurrent
+# tail    = current A (0.01) which ends the CV stage, default cc / CHARGE_TAIL_DIV
+# state   = mwcanstate of candev, v_out_read / i_out_read are taken from its cache
+#
+# CHARGE_CC    v_out_set = boost, i_out_set = cc, the BIC regulates the current
+#              --> CV if v >= boost - CHARGE_V_BAND
+# CHARGE_CV    BIC holds boost, the current goes down
+#              the current limit follows the current down (taper) if it is
+#              CHARGE_TAPER_DEADBAND below the last written limit
+#              --> FLOAT if i <= tail or after CHARGE_CV_TIMEOUT seconds
+#              --> CC if v < boost - CHARGE_REBULK (tapered limit too low for a new load)
+# CHARGE_FLOAT v_out_set = floatv, i_out_set = cc
+#              --> CC if v < floatv - CHARGE_REBULK (battery is discharged by a load)
+# Every change of stage must be seen in CHARGE_DEBOUNCE samples one after the other.
+# Setpoints are only written if they change.
+#
+# chg.start()          --> charge direction, output on, CC stage, thread polls every period
+# chg.step(v, i)       --> own loop instead of the thread, values from anywhere
+# chg.poll()           --> one step with fresh values of state, if the device does not
+#                          answer the stage is held (counters["missed"]), no step on old values
+# chg.stop()           --> output off
+# chg.stage, chg.counters = {"samples", "writes", "transitions", "missed"}
+#
+# With many tapering writes use candev.dynamic_control() to spare the EEPROM.
+######################################################################################
+
+CHARGE_OFF   = 0
+CHARGE_CC    = 1
+CHARGE_CV    = 2
+CHARGE_FLOAT = 3
+CHARGE_NAMES = {CHARGE_OFF: "OFF", CHARGE_CC: "CC", CHARGE_CV: "CV", CHARGE_FLOAT: "FLOAT"}
+
+CHARGE_V_BAND         = 10    #V (0.01) below boost which counts as CV
+CHARGE_REBULK         = 100   #V (0.01) below float --> CC again
+CHARGE_TAIL_DIV       = 20    #tail current = cc / 20
+CHARGE_TAPER_HEADROOM = 100   #A (0.01) current limit above the measured current in CV
+CHARGE_TAPER_DEADBAND = 200   #A (0.01) min change of the current limit
+CHARGE_CV_TIMEOUT     = 14400 #seconds
+CHARGE_DEBOUNCE       = 3     #samples
+
+class mwcancharge:
+
+    def __init__(self, dev, boost=None, floatv=None, cc=None, tail=None, state=None, period=0.2):
+        if dev.USEDMWHW != DEV_BIC_2200:
+            raise Exception("mwcancharge: only for BIC-2200, the NPB has own charge curves")
+        self.dev    = dev
+        self.boost  = dev.dev_BoostChargeVoltage if boost  is None else boost
+        self.floatv = dev.dev_FloatChargeVoltage if floatv is None else floatv
+        self.cc     = dev.dev_MaxChargeCurrent   if cc     is None else cc
+        self.tail   = self.cc // CHARGE_TAIL_DIV if tail   is None else tail
+        if self.boost <= 0 or self.floatv <= 0 or self.floatv > self.boost:
+            raise Exception("mwcancharge: boost / float voltage not set (" + str(self.boost) + " / " + str(self.floatv) + ")")
+        self.state   = mwcanstate(dev) if state is None else state
+        self.period  = period
+        self.taper   = True
+        self.stage   = CHARGE_OFF
+        self.since   = 0.0   #time of the last stage change
+        self.count   = 0     #samples the next stage condition is true
+        self.setv    = None  #last written setpoints
+        self.seti    = None
+        self.counters = {"samples": 0, "writes": 0, "transitions": 0, "missed": 0}
+        self.thread  = None
+        self.running = threading.Event()
+
+    #########################################
+    # setpoints
+    def set_v(self, v):
+        if v != self.setv:
+            self.state.write("v_out_set", v)
+            self.setv = v
+            self.counters["writes"] += 1
+
+    def set_i(self, i):
+        if i != self.seti:
+            self.state.write("i_out_set", i)
+            self.seti = i
+            self.counters["writes"] += 1
+
+    def enter(self, stage, now):
+        logging.info("mwcancharge: " + hex(self.dev.CAN_ADR) + " " + CHARGE_NAMES[self.stage] + " -> " + CHARGE_NAMES[stage])
+        self.stage = stage
+        self.since = now
+        self.count = 0
+        self.counters["transitions"] += 1
+        if stage == CHARGE_CC:
+            self.set_v(self.boost)
+            self.set_i(self.cc)
+        elif stage == CHARGE_FLOAT:
+            self.set_v(self.floatv)
+            self.set_i(self.cc)
+
+    def debounce(self, cond):
+        self.count = self.count + 1 if cond else 0
+        return self.count >= CHARGE_DEBOUNCE
+
+    #########################################
+    # state machine
+    def step(self, v, i, now=None):
+        if now is None: now = time.monotonic()
+        if self.stage == CHARGE_OFF or v == -1: return self.stage
+        self.counters["samples"] += 1
+
+        if self.stage == CHARGE_CC:
+            if self.debounce(v >= self.boost - CHARGE_V_BAND):
+                self.enter(CHARGE_CV, now)
+
+        elif self.stage == CHARGE_CV:
+            if self.debounce(i <= self.tail or v < self.boost - CHARGE_REBULK):
+                self.enter(CHARGE_FLOAT if i <= self.tail else CHARGE_CC, now)
+            elif now - self.since >= CHARGE_CV_TIMEOUT:
+                self.enter(CHARGE_FLOAT, now)
+            elif self.taper:
+                limit = max(self.tail, i + CHARGE_TAPER_HEADROOM)
+                if self.seti - limit >= CHARGE_TAPER_DEADBAND:
+                    self.set_i(limit)
+
+        elif self.stage == CHARGE_FLOAT:
+            if self.debounce(v < self.floatv - CHARGE_REBULK):
+                self.enter(CHARGE_CC, now)
+
+        return self.stage
+
+    def poll(self):
+        state = self.state
+        state.refresh("v_out_read", "i_out_read")
+        now = time.monotonic()
+        if not (state.fresh("v_out_read", now) and state.fresh("i_out_read", now)):
+            #no reply, the cache only has old values
+            self.counters["missed"] += 1
+            self.count = 0 #debounce samples must follow one after the other
+            logging.warning("mwcancharge: " + hex(self.dev.CAN_ADR) + " no voltage / current, stage " + CHARGE_NAMES[self.stage] + " held")
+            return self.stage
+        return self.step(state.cache["v_out_read"][0], state.cache["i_out_read"][0], now)
+
+    #########################################
+    # thread
+    def run(self):
+        while self.running.is_set():
+            t = time.monotonic()
+            self.poll()
+            wait = self.period - (time.monotonic() - t)
+            if wait > 0: time.sleep(wait)
+
+    def start(self):
+        self.state.write("BIC_chargemode", 0)
+        self.enter(CHARGE_CC, time.monotonic())
+        self.state.write("operation", 1)
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, name="mwcancharge", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.state.write("operation", 0)
+        self.stage = CHARGE_OFF
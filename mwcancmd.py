@@ -19,13 +19,17 @@
 # macGH 26.03.2024  Version 0.2.8: Added systemconfig read write
 # macGH 13.05.2024  Version 0.2.9: Added NPB config curve read
 # macGH 24.09.2024  Version 0.3.0: Added BIC read Fanspeed
+# agent 19.10.2026  Version 0.3.1: Batch mode, more commands / script file / stdin in one run, JSON or CSV output
+# agent 19.10.2026  Version 0.3.2: Watch mode, stream timestamped pipelined reads until interrupted
+# agent 19.10.2026  Version 0.3.3: FASTCONNECT, removed unused imports for faster start
+# agent 19.10.2026  Version 0.3.4: USESLCAN, open the USB-CAN adapter directly without slcand and sudo
+# agent 19.10.2026  Version 0.3.5: OWNERSHIP, run next to a service using the same CAN interface
 
-import os
-import can
 import sys
 import signal
 import atexit
-import ifcfg
+import json
+import time
 from mwcan import *
 
 ####################################################
@@ -42,6 +46,21 @@ USEDID = "03"
 # if you have another device specify here
 RS232DEV = "" 
 
+# 1 = CAN interface is already up (e.g. systemd-networkd) and the device type
+#     is taken from the identity cache --> much faster start, see mwcan connect()
+# 0 = check / create the interface and read the device type every start
+FASTCONNECT = 0
+
+# 1 = python-can opens RS232DEV directly with the slcan protocol, no slcand / ip link / sudo
+#     The adapter must not be used by slcand at the same time
+# 0 = kernel SocketCAN interface can0
+USESLCAN = 0
+
+# 1 = lock every read per command code against other processes on the same interface
+#     and skip replies to their requests (see mwcan CAN_OWNERSHIP), the other process
+#     must use it too
+OWNERSHIP = 1
+
 # Enter Loglevel 0,10,20,30,40,50 
 # CRITICAL   50
 # ERROR      40
@@ -54,7 +73,8 @@ logtofile    = 0
 logtoconsole = 1
 
 def on_exit():
-    print("CLEAN UP ...")
+    if BATCH: logging.info("CLEAN UP ...") #keep stdout clean for JSON/CSV
+    else:     print("CLEAN UP ...")
     candev.can_down()
     
 def handle_exit(signum, frame):
@@ -66,6 +86,17 @@ def mwcan_commands():
     print("")
     print(" Usage:")
     print("        " + sys.argv[0] + " parameter and <value>")
+    print("        " + sys.argv[0] + " [--json|--csv] [-f <file>|-f -] parameter <value> parameter ...")
+    print("")
+    print("       More than one parameter, a script file (-f) or stdin (-f -) runs all")
+    print("       parameters over one connection, reads are pipelined.")
+    print("       Output is JSON (default, --json) or CSV (--csv)")
+    print("")
+    print("        " + sys.argv[0] + " watch [--hz <rate>] [--json|--csv] read parameter ...")
+    print("")
+    print("       Stream timestamped samples of the read parameters until interrupted")
+    print("       Output is CSV (default, --csv) or JSON lines (--json), default rate 1 Hz")
+    print("       Achieved rate and missed deadlines are reported on stderr at the end")
     print("")
     print("       on                      -- output on")
     print("       off                     -- output off")
@@ -104,7 +135,7 @@ def mwcan_commands():
     print("")
     print("       <value> = amps oder volts * 100 --> 25,66V = 2566")
     print("")
-    print("       Version 0.2.6 ")
+    print("       Version 0.3.5 ")
 
 #########################################
 # Operation function
@@ -287,6 +318,205 @@ def faultread():
     candev.decode_fault_status(v)
     return v
 
+#########################################
+# Batch mode
+
+# reads which can be pipelined: command code and conversion of the raw value
+BATCH_READS = {
+    'readonoff':        (0x00,0x00),
+    'cvread':           (0x20,0x00),
+    'ccread':           (0x30,0x00),
+    'dvread':           (0x20,0x01),
+    'dcread':           (0x30,0x01),
+    'vread':            (0x60,0x00),
+    'cread':            (0x61,0x00),
+    'acvread':          (0x50,0x00),
+    'tempread':         (0x62,0x00),
+    'fan1':             (0x70,0x00),
+    'fan2':             (0x71,0x00),
+    'firmwareread':     (0x84,0x00),
+    'faultread':        (0x40,0x00),
+    'statusread':       (0xC1,0x00),
+    'readscaling':      (0xC0,0x00),
+    'systemconfigread': (0xC2,0x00),
+    'NPB_readcurve':    (0xB4,0x00),
+}
+
+# all other commands, function and number of values
+BATCH_CMDS = {
+    'on':              (lambda: candev.operation(1,1), 0),
+    'off':             (lambda: candev.operation(1,0), 0),
+    'cvset':           (lambda v: candev.v_out_set(1,v), 1),
+    'ccset':           (lambda v: candev.i_out_set(1,v), 1),
+    'dvset':           (lambda v: candev.BIC_discharge_v(1,v), 1),
+    'dcset':           (lambda v: candev.BIC_discharge_i(1,v), 1),
+    'charge':          (lambda: candev.BIC_chargemode(1,0), 0),
+    'discharge':       (lambda: candev.BIC_chargemode(1,1), 0),
+    'typeread':        (lambda: candev.type_read().strip(), 0),
+    'serialread':      (lambda: candev.serial_read().strip(), 0),
+    'systemconfigset': (lambda v: candev.system_config(1,v), 1),
+    'NPB_chargemode':  (lambda v: candev.NPB_curve_config_pos(1,CURVE_CONFIG_CUVE,v), 1),
+}
+
+def batch_parse(tokens):
+    # --> list of (name, [values])
+    cmds = []
+    i = 0
+    while i < len(tokens):
+        name = tokens[i]
+        i += 1
+        if name in BATCH_READS:
+            cmds.append((name, []))
+        elif name in BATCH_CMDS:
+            n = BATCH_CMDS[name][1]
+            if i + n > len(tokens):
+                raise ValueError("Value missing for '" + name + "'")
+            cmds.append((name, [int(v) for v in tokens[i:i+n]]))
+            i += n
+        else:
+            raise ValueError("Unknown parameter '" + name + "'")
+    return cmds
+
+def batch_run(cmds):
+    # --> list of (name, value), following reads are sent as one pipelined request
+    results = []
+    i = 0
+    while i < len(cmds):
+        if cmds[i][0] in BATCH_READS:
+            j = i
+            while j < len(cmds) and cmds[j][0] in BATCH_READS: j += 1
+            names  = [name for name, values in cmds[i:j]]
+            values = candev.can_read_multi(list(dict.fromkeys(BATCH_READS[name] for name in names)))
+            for name in names:
+                v = values[BATCH_READS[name]]
+                if name == 'cread' and v != -1: v = candev.i_out_signed(v)
+                results.append((name, v))
+            i = j
+        else:
+            name, values = cmds[i]
+            results.append((name, BATCH_CMDS[name][0](*values)))
+            i += 1
+    return results
+
+def batch_print(results, fmt):
+    if fmt == "csv":
+        print(",".join(name for name, v in results))
+        print(",".join(str(v) for name, v in results))
+    else:
+        print(json.dumps({name: v for name, v in results}))
+
+def batch_tokens(argv):
+    # --> format, tokens from command line, script file or stdin
+    fmt = "json"
+    tokens = []
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a == "--json":  fmt = "json"
+        elif a == "--csv": fmt = "csv"
+        elif a == "-f":
+            i += 1
+            f = sys.stdin if argv[i] == "-" else open(argv[i])
+            for line in f:
+                tokens += line.split("#")[0].split()
+            if f is not sys.stdin: f.close()
+        else:
+            tokens.append(a)
+        i += 1
+    return fmt, tokens
+
+def batch_mode():
+    #any batch option or more than one parameter
+    args = sys.argv[1:]
+    if args and args[0] == "watch": return True
+    if any(a in ["--json", "--csv", "-f"] for a in args): return True
+    if len(args) < 2: return False
+    return not (args[0] in BATCH_CMDS and BATCH_CMDS[args[0]][1] == len(args) - 1)
+
+def command_line_batch():
+    fmt, tokens = batch_tokens(sys.argv[1:])
+    try:
+        cmds = batch_parse(tokens)
+    except ValueError as err:
+        print("")
+        print("Error: " + str(err))
+        mwcan_commands()
+        return
+    batch_print(batch_run(cmds), fmt)
+
+#########################################
+# Watch mode
+
+def command_line_watch():
+    hz  = 1.0
+    fmt = "csv"
+    names = []
+    args = sys.argv[2:]
+    i = 0
+    while i < len(args):
+        if args[i] == "--hz":
+            i += 1
+            hz = float(args[i])
+        elif args[i] == "--json": fmt = "json"
+        elif args[i] == "--csv":  fmt = "csv"
+        elif args[i] in BATCH_READS: names.append(args[i])
+        else:
+            print("")
+            print("Error: watch only supports read parameter, unknown '" + args[i] + "'")
+            mwcan_commands()
+            return
+        i += 1
+
+    if not names or hz <= 0:
+        print("")
+        print("Error: watch needs a rate > 0 and at least one read parameter")
+        mwcan_commands()
+        return
+
+    cmds   = list(dict.fromkeys(BATCH_READS[name] for name in names))
+    period = 1.0 / hz
+    #reply timeout must not eat the next period
+    candev.CAN_TIMEOUT = min(candev.CAN_TIMEOUT, period)
+
+    if fmt == "csv": print("time," + ",".join(names), flush=True)
+    samples = 0
+    missed  = 0
+    start   = time.monotonic()
+    last    = start
+    nextt   = start
+    try:
+        while True:
+            t = time.time()
+            values = candev.can_read_multi(cmds)
+            row = []
+            for name in names:
+                v = values[BATCH_READS[name]]
+                if name == 'cread' and v != -1: v = candev.i_out_signed(v)
+                row.append(v)
+            samples += 1
+            last = time.monotonic()
+            if fmt == "csv":
+                print(str(round(t, 3)) + "," + ",".join(str(v) for v in row), flush=True)
+            else:
+                d = {"time": round(t, 3)}
+                d.update(zip(names, row))
+                print(json.dumps(d), flush=True)
+
+            nextt += period
+            wait = nextt - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                #deadline missed, do not try to catch up
+                missed += 1
+                nextt = time.monotonic()
+    finally:
+        elapsed = time.monotonic() - start
+        rate = (samples - 1) / (last - start) if samples > 1 else 0
+        print("watch: " + str(samples) + " samples in " + str(round(elapsed, 2)) + " s, "
+              + str(round(rate, 2)) + " Hz (requested " + str(hz) + " Hz), "
+              + str(missed) + " missed deadlines", file=sys.stderr)
+
 def command_line_argument():
     if len (sys.argv) == 1:
         print ("")
@@ -332,6 +562,7 @@ def command_line_argument():
         return
 
 #### Main 
+BATCH = batch_mode()
 atexit.register(on_exit)
 signal.signal(signal.SIGTERM, handle_exit)
 signal.signal(signal.SIGINT, handle_exit)
@@ -363,10 +594,17 @@ if logtoconsole == 1:
     mylogs.addHandler(stream)
 
 
-candev = mwcan(USEDMW,USEDID,RS232DEV,LOGLEVEL)
-candev.can_up()
-print("Found Device: " + candev.mwtype)
+candev = mwcan(USEDMW,USEDID,RS232DEV,LOGLEVEL,"can0",CAN_BACKEND_SLCAN if USESLCAN == 1 else CAN_BACKEND_SOCKETCAN)
+candev.CAN_OWNERSHIP = OWNERSHIP == 1
+if FASTCONNECT == 1: candev.connect()
+else:                candev.can_up()
 
-command_line_argument()
+if BATCH:
+    logging.info("Found Device: " + candev.mwtype)
+    if sys.argv[1] == "watch": command_line_watch()
+    else:                      command_line_batch()
+else:
+    print("Found Device: " + candev.mwtype)
+    command_line_argument()
 
 sys.exit(0)
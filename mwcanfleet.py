@@ -0,0 +1,248 @@
+############################################################################
+#    This lib is free software; you can redistribute it and/or modify      #
+#    it under the terms of the LGPL                                        #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+############################################################################
+
+# Controlling many Mean Well devices on one or more CAN interfaces
+# Use at your own risk !
+
+# Version history
+# agent 19.10.2026  Version 0.1.0: Multi bus coordinator, one worker per CAN interface
+# agent 19.10.2026  Version 0.1.1: Added group_write, one broadcast frame per interface
+# agent 19.10.2026  Version 0.1.2: Added mwcanalloc, spread a power target across paralleled BIC-2200
+# agent 19.10.2026  Version 0.1.3: backend per interface (socketcan / slcan)
+# agent 19.10.2026  Version 0.1.4: iface_restart, recovery of the shared Bus of an interface
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from mwcan import *
+
+######################################################################################
+# Explanations
+######################################################################################
+
+######################################################################################
+# fleet = mwcanfleet(loglevel)
+# key   = fleet.add_device(usedmwdev, mwcanid, caniface, devpath, backend)
+#
+# Every CAN interface gets one worker thread. All requests for devices on that
+# interface are executed in order by its worker, requests on different
+# interfaces run at the same time.
+# All devices on one interface share the python-can Bus of the first device.
+#
+# key = (caniface, usedmwdev, mwcanid)
+#
+# fleet.fleet_up()
+# fleet.read_all("v_out_read")            --> {key: value, ...}
+# fleet.write_all("BIC_discharge_i", 2000) --> {key: value, ...}
+# fleet.submit(key, "i_out_read")         --> concurrent.futures.Future
+# fleet.group_write("BIC_discharge_i", 2000, DEV_BIC_2200) --> one broadcast frame per interface
+# fleet.restart(caniface)                 --> can_restart of the Bus owner, all other devices
+#                                             of the interface get the new Bus and resync
+# fleet.fleet_down()
+######################################################################################
+
+######################################################################################
+# alloc  = mwcanalloc(devices, deadband)
+# writes = alloc.allocate(target, vout, faults)
+# alloc.apply(writes)
+#
+# devices  = list of mwcan BIC-2200 instances (can_up done, ini values read)
+# deadband = current change in A (0.01) below which a running unit is not rewritten
+# target   = total power in W, > 0 charge battery, < 0 discharge battery
+# vout     = {dev: v_out_read()} live DC voltages in V (0.01)
+# faults   = {dev: fault_status_read()} units with a fault in FAULT_MASK are switched off
+#
+# Units are filled up to their limit one after the other, the last one takes the
+# rest and all others stay off. Units already running keep their place, so in a
+# steady state only the one partial unit gets a new setpoint.
+# allocate returns only the writes needed: [(dev, "operation"|"BIC_chargemode"|
+# "i_out_set"|"BIC_discharge_i", val), ...]
+######################################################################################
+
+#FAULT bits which stop a unit from being used
+FAULT_MASK = (1<<FAULT_FAN_FAIL) | (1<<FAULT_OTP) | (1<<FAULT_OVP) | (1<<FAULT_OLP) | (1<<FAULT_SHORT) | \
+             (1<<FAULT_AC_FAIL) | (1<<FAULT_HI_TEMP) | (1<<FAULT_HV_OVP)
+
+class mwcanfleet:
+
+    def __init__(self, loglevel=20):
+        self.loglevel = loglevel
+        self.devices  = {} #key -> mwcan
+        self.workers  = {} #caniface -> worker
+
+    def add_device(self, usedmwdev, mwcanid, caniface="can0", devpath="", backend=CAN_BACKEND_SOCKETCAN):
+        #with CAN_BACKEND_SLCAN use the same caniface name for all devices on one adapter
+        key = (caniface, usedmwdev, mwcanid)
+        self.devices[key] = mwcan(usedmwdev, mwcanid, devpath, self.loglevel, caniface, backend)
+        if caniface not in self.workers:
+            self.workers[caniface] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mwcan-" + caniface)
+        logging.debug("mwcanfleet: added device " + str(key))
+        return key
+
+    def iface_devices(self, caniface):
+        return [(key, dev) for key, dev in self.devices.items() if key[0] == caniface]
+
+    #########################################
+    # up / down
+    def iface_up(self, caniface):
+        owner = None
+        for key, dev in self.iface_devices(caniface):
+            if owner is None:
+                dev.can_up()
+                owner = dev
+            else:
+                dev.can_up(bus=owner.can0)
+            logging.info("mwcanfleet: " + str(key) + " found " + dev.mwtype)
+
+    def iface_down(self, caniface):
+        #shared devices first, the owner removes the interface
+        for key, dev in reversed(self.iface_devices(caniface)):
+            dev.can_down()
+
+    def iface_restart(self, caniface):
+        #only the owner (first device) closes and opens the Bus, then all others use the new one
+        devs  = self.iface_devices(caniface)
+        owner = devs[0][1]
+        tier  = owner.can_restart()
+        for key, dev in devs[1:]:
+            dev.can0 = owner.can0
+            checked, fixed = dev.can_resync()
+            logging.info("mwcanfleet: " + str(key) + " rebound, " + str(fixed) + " of " + str(checked) + " setpoints written again")
+        return tier
+
+    def restart(self, caniface):
+        return self.workers[caniface].submit(self.iface_restart, caniface).result()
+
+    def fleet_up(self):
+        futures = [worker.submit(self.iface_up, caniface) for caniface, worker in self.workers.items()]
+        for f in futures:
+            f.result()
+
+    def fleet_down(self):
+        futures = [worker.submit(self.iface_down, caniface) for caniface, worker in self.workers.items()]
+        for f in futures:
+            f.result()
+        for worker in self.workers.values():
+            worker.shutdown()
+        self.workers = {}
+
+    #########################################
+    # requests
+    def submit(self, key, func, *args):
+        # func = name of the mwcan function, e.g. "v_out_read"
+        dev = self.devices[key]
+        return self.workers[key[0]].submit(getattr(dev, func), *args)
+
+    def call_all(self, func, *args, keys=None):
+        if keys is None: keys = list(self.devices)
+        futures = [(key, self.submit(key, func, *args)) for key in keys]
+        return {key: f.result() for key, f in futures}
+
+    def read_all(self, func, keys=None):
+        return self.call_all(func, keys=keys)
+
+    def write_all(self, func, val, keys=None):
+        return self.call_all(func, 1, val, keys=keys)
+
+    def group_write(self, func, val, usedmwdev=DEV_BIC_2200):
+        futures = []
+        for caniface, worker in self.workers.items():
+            devs = [dev for key, dev in self.iface_devices(caniface) if key[1] == usedmwdev]
+            if devs:
+                futures.append(worker.submit(devs[0].group_write, getattr(devs[0], func), val, None, devs[1:]))
+        return [f.result() for f in futures]
+
+
+class mwcanalloc:
+
+    def __init__(self, devices, deadband=50):
+        self.devices  = devices
+        self.deadband = deadband
+        #last written (on, direction, current) per unit, None = unknown, write everything
+        self.state    = {dev: None for dev in devices}
+
+    def unit_limits(self, dev, direction, v):
+        #min, max current in A (0.01) for this direction at voltage v (0.01)
+        if direction == 0:
+            imin, imax = dev.dev_MinChargeCurrent, dev.dev_MaxChargeCurrent
+        else:
+            imin, imax = dev.dev_MinDisChargeCurrent, dev.dev_MaxDisChargeCurrent
+        imax = min(imax, dev.dev_MaxWatt * 10000 // v)
+        return imin, imax
+
+    def allocate(self, target, vout, faults=None):
+        if faults is None: faults = {}
+        direction = 0 if target >= 0 else 1
+        remaining = abs(target) * 10000 #W --> V (0.01) * A (0.01)
+
+        usable = []
+        for dev in self.devices:
+            if faults.get(dev, 0) & FAULT_MASK:
+                logging.warning("mwcanalloc: " + dev.mwtype + " " + hex(dev.CAN_ADR) + " fault, not used")
+            elif vout.get(dev, -1) > 0:
+                usable.append(dev)
+
+        #running units in the same direction first, full ones before the partial one
+        def running(dev):
+            st = self.state[dev]
+            if st is None or st[0] == 0 or st[1] != direction: return 0
+            return st[2]
+        usable.sort(key=running, reverse=True)
+
+        plan = {}
+        for dev in usable:
+            v = vout[dev]
+            imin, imax = self.unit_limits(dev, direction, v)
+            need = remaining // v
+            if need >= imax:   i = imax
+            elif need >= imin: i = need
+            else:              i = 0
+
+            if i > 0:
+                st = self.state[dev]
+                if st is not None and st[0] == 1 and st[1] == direction and i < imax and abs(i - st[2]) < self.deadband:
+                    i = st[2] #small change, keep the running setpoint
+                plan[dev] = (1, direction, i)
+                remaining -= i * v
+            else:
+                plan[dev] = (0, None, None)
+
+        for dev in self.devices:
+            if dev not in plan: plan[dev] = (0, None, None)
+
+        return self.plan_writes(plan)
+
+    def plan_writes(self, plan):
+        #switch off first, then setpoints, then switch on
+        offs, sets, ons = [], [], []
+        for dev, (on, direction, i) in plan.items():
+            st = self.state[dev]
+            if on == 0:
+                if st is None or st[0] != 0:
+                    offs.append((dev, "operation", 0))
+                continue
+            if st is None or st[1] != direction:
+                sets.append((dev, "BIC_chargemode", direction))
+            if st is None or st[1] != direction or st[2] != i:
+                sets.append((dev, "i_out_set" if direction == 0 else "BIC_discharge_i", i))
+            if st is None or st[0] != 1:
+                ons.append((dev, "operation", 1))
+        return offs + sets + ons
+
+    def apply(self, writes):
+        for dev, func, val in writes:
+            getattr(dev, func)(1, val)
+            st = self.state[dev]
+            on, direction, i = st if st is not None else (0, None, None)
+            if func == "operation":        on = val
+            elif func == "BIC_chargemode": direction = val
+            else:                          i = val
+            self.state[dev] = (on, direction, i)
+        logging.debug("mwcanalloc: " + str(len(writes)) + " writes")
+        return len(writes)
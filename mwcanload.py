@@ -0,0 +1,196 @@
+############################################################################
+#    This lib is free software; you can redistribute it and/or modify      #
+#    it under the terms of the LGPL                                        #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+############################################################################
+
+# CAN bus load monitor with adaptive poll rates
+# Use at your own risk !
+
+# Version history
+# agent 19.10.2026  Version 0.1.0: Bus utilization, share per device command, throttling of low priority pollers
+
+import logging
+import threading
+import time
+from mwcan import *
+
+######################################################################################
+# Explanations
+######################################################################################
+
+######################################################################################
+# load = mwcanload(caniface="can0", budget=0.5, window=1.0)
+#
+# Opens an own SocketCAN socket on caniface and sees every frame on the bus:
+# BMS, inverter, ... and the requests of all mwcan instances of this host (loopback).
+# Every frame is counted with its length in bits (extended / standard frame,
+# worst case bit stuffing, interframe space), utilization = bits / (CAN_BITRATE * window).
+# Requests (0x000C03xx / 0x000C01xx) and replies (0x000C02xx / 0x000C00xx) are
+# counted per device address and command code.
+#
+# load.throttle(obj, LOAD_PRIO_LOW)  obj = anything polling with obj.period, e.g.
+#                                    mwcanwatch, mwcanpublisher
+# Utilization over budget at the end of a window --> level + 1, the period of all
+# LOAD_PRIO_LOW pollers is base period * 2 ** level (up to LOAD_MAX_LEVEL).
+# Under budget * LOAD_HYSTERESIS for LOAD_RECOVER windows --> level - 1.
+# LOAD_PRIO_HIGH pollers are never slowed down.
+#
+# load.start() / load.stop()
+# load.state() --> {"util", "util_peak", "frames", "error_frames", "budget", "level",
+#                   "foreign", "periods": {name: period}, "shares": {"0x000c0300:0x0060": share}}
+#
+# Not possible with CAN_BACKEND_SLCAN, the adapter has only one user. Feed the frames
+# yourself with load.frame(msg) and call load.tick() once per window.
+######################################################################################
+
+LOAD_PRIO_HIGH = 0
+LOAD_PRIO_LOW  = 1
+
+LOAD_MAX_LEVEL  = 4   #slowest = 16 x base period
+LOAD_HYSTERESIS = 0.8
+LOAD_RECOVER    = 5   #windows under budget * LOAD_HYSTERESIS before a level is removed
+
+#request / reply ID prefixes (ID >> 8) of both device families
+LOAD_REQUEST = {0x000C03, 0x000C01}
+LOAD_REPLY   = {0x000C02: 0x000C03, 0x000C00: 0x000C01}
+
+def frame_bits(msg):
+    #frame length on the wire with worst case stuffing and 3 bit interframe space
+    n = 8 * msg.dlc
+    if msg.is_extended_id:
+        return n + 67 + (n + 53) // 4
+    return n + 47 + (n + 33) // 4
+
+class mwcanload:
+
+    def __init__(self, caniface="can0", budget=0.5, window=1.0, bitrate=CAN_BITRATE):
+        self.caniface = caniface
+        self.budget   = budget
+        self.window   = window
+        self.bitrate  = bitrate
+        self.lock     = threading.Lock()
+        self.pollers  = [] #[obj, prio, base period, name]
+        self.level    = 0
+        self.calm     = 0  #windows under budget * LOAD_HYSTERESIS
+        self.bus      = None
+        self.thread   = None
+        self.running  = threading.Event()
+        self.reset_window()
+        self.result   = {"util": 0.0, "util_peak": 0.0, "frames": 0, "error_frames": 0,
+                         "foreign": 0.0, "shares": {}}
+
+    def reset_window(self):
+        self.start_t = time.monotonic()
+        self.bits    = 0
+        self.frames  = 0
+        self.errors  = 0
+        self.cmdbits = {} #(CAN_ADR, command code) -> bits of requests and replies
+
+    #########################################
+    # counting
+    def frame(self, msg):
+        if msg.is_error_frame:
+            with self.lock: self.errors += 1
+            return
+        bits = frame_bits(msg)
+        key = None
+        if msg.is_extended_id and msg.dlc >= 2:
+            prefix = msg.arbitration_id >> 8
+            if prefix in LOAD_REQUEST:
+                key = (msg.arbitration_id, (msg.data[1] << 8) | msg.data[0])
+            elif prefix in LOAD_REPLY:
+                key = ((LOAD_REPLY[prefix] << 8) | (msg.arbitration_id & 0xFF), (msg.data[1] << 8) | msg.data[0])
+        with self.lock:
+            self.bits   += bits
+            self.frames += 1
+            if key is not None:
+                self.cmdbits[key] = self.cmdbits.get(key, 0) + bits
+
+    def tick(self, now=None):
+        #end of window: utilization, shares and throttling
+        if now is None: now = time.monotonic()
+        with self.lock:
+            span = max(now - self.start_t, 1e-6)
+            bits, frames, errors, cmdbits = self.bits, self.frames, self.errors, self.cmdbits
+            self.reset_window()
+            self.start_t = now
+
+        util = bits / (self.bitrate * span)
+        own  = sum(cmdbits.values())
+        self.result = {"util": util, "util_peak": max(util, self.result["util_peak"]),
+                       "frames": frames, "error_frames": self.result["error_frames"] + errors,
+                       "foreign": (bits - own) / bits if bits else 0.0,
+                       "shares": {format(adr, '#010x') + ":" + format(cmd, '#06x'): b / bits
+                                  for (adr, cmd), b in cmdbits.items()}}
+        self.adapt(util)
+        return util
+
+    #########################################
+    # throttling
+    def throttle(self, obj, prio=LOAD_PRIO_LOW, name=None):
+        if name is None: name = type(obj).__name__ + "-" + str(len(self.pollers))
+        self.pollers.append([obj, prio, obj.period, name])
+        self.apply()
+
+    def adapt(self, util):
+        level = self.level
+        if util > self.budget:
+            self.calm = 0
+            if level < LOAD_MAX_LEVEL: level += 1
+        elif util < self.budget * LOAD_HYSTERESIS:
+            self.calm += 1
+            if self.calm >= LOAD_RECOVER and level > 0:
+                level -= 1
+                self.calm = 0
+        else:
+            self.calm = 0
+        if level != self.level:
+            logging.warning("mwcanload: " + self.caniface + " utilization " + str(round(util * 100, 1))
+                            + " % (budget " + str(round(self.budget * 100)) + " %), throttle level " + str(level))
+            self.level = level
+            self.apply()
+
+    def apply(self):
+        for obj, prio, base, name in self.pollers:
+            obj.period = base if prio == LOAD_PRIO_HIGH else base * (2 ** self.level)
+
+    def state(self):
+        r = dict(self.result)
+        r["budget"]  = self.budget
+        r["level"]   = self.level
+        r["periods"] = {name: obj.period for obj, prio, base, name in self.pollers}
+        return r
+
+    #########################################
+    # thread
+    def run(self):
+        while self.running.is_set():
+            msg = self.bus.recv(min(0.1, self.window))
+            if msg is not None: self.frame(msg)
+            now = time.monotonic()
+            if now - self.start_t >= self.window: self.tick(now)
+
+    def start(self):
+        import can
+        self.bus = can.interface.Bus(channel = self.caniface, bustype = 'socketcan')
+        self.reset_window()
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, name="mwcanload", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.bus is not None:
+            self.bus.shutdown()
+            self.bus = None
+        #back to the normal rates
+        self.level = 0
+        self.apply()
@@ -0,0 +1,141 @@
+############################################################################
+#    This lib is free software; you can redistribute it and/or modify      #
+#    it under the terms of the LGPL                                        #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+############################################################################
+
+# Priority command scheduler for one shared mwcan instance
+# Use at your own risk !
+
+# Version history
+# agent 19.10.2026  Version 0.1.0: Priority classes, deadlines, merge and drop of stale reads
+# agent 19.10.2026  Version 0.1.1: submit after stop raises, CAN_TIMEOUT restored after every request
+
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+######################################################################################
+# Explanations
+######################################################################################
+
+######################################################################################
+# sched = mwcansched(candev)
+#
+# All requests to candev from all threads go through one worker thread.
+# The next request is always the one with the highest priority (lowest number).
+#
+# PRIO_SAFETY    = output off and other protection writes
+# PRIO_SETPOINT  = setpoint writes
+# PRIO_TELEMETRY = measurement / status reads
+# PRIO_IDENTITY  = type, serial, firmware, scaling reads
+#
+# fut = sched.submit(PRIO_SETPOINT, "BIC_discharge_i", 1, 2000) --> concurrent.futures.Future
+# v   = sched.call(PRIO_TELEMETRY, "v_out_read")                --> value, waits for the result
+# sched.off()                                                   --> operation off with PRIO_SAFETY
+#
+# SCHED_DEADLINE: seconds a request may wait in the queue. Reads (PRIO_TELEMETRY,
+# PRIO_IDENTITY) past their deadline are dropped with result -1, writes are never dropped.
+# The same read already waiting in the queue is merged, both callers get the same Future.
+# SCHED_TIMEOUT: receive timeout per class. A short telemetry timeout bounds the time a
+# setpoint write waits behind a read already on the bus. candev.CAN_TIMEOUT is set
+# only for the request and restored afterwards.
+# After sched.stop() submit / call / off raise an exception, nothing is sent any more.
+# sched.counters = {"done", "merged", "dropped", "late"}
+######################################################################################
+
+PRIO_SAFETY    = 0
+PRIO_SETPOINT  = 1
+PRIO_TELEMETRY = 2
+PRIO_IDENTITY  = 3
+
+SCHED_DEADLINE = {PRIO_SAFETY: 0.05, PRIO_SETPOINT: 0.2, PRIO_TELEMETRY: 1.0, PRIO_IDENTITY: 5.0}
+SCHED_TIMEOUT  = {PRIO_SAFETY: 0.5,  PRIO_SETPOINT: 0.5, PRIO_TELEMETRY: 0.1, PRIO_IDENTITY: 0.5}
+
+class mwcansched:
+
+    def __init__(self, dev, deadline=None, timeout=None):
+        self.dev      = dev
+        self.deadline = dict(SCHED_DEADLINE if deadline is None else deadline)
+        self.timeout  = dict(SCHED_TIMEOUT  if timeout  is None else timeout)
+        self.queue    = []  #heap of (prio, seq, deadline, key, func, args, future)
+        self.waiting  = {}  #key -> future of queued reads, for merging
+        self.seq      = 0
+        self.cond     = threading.Condition()
+        self.running  = True
+        self.counters = {"done": 0, "merged": 0, "dropped": 0, "late": 0}
+        self.thread   = threading.Thread(target=self.run, name="mwcansched", daemon=True)
+        self.thread.start()
+
+    #########################################
+    # submit
+    def submit(self, prio, func, *args):
+        # func = name of the mwcan function, e.g. "v_out_read"
+        key = (func,) + args
+        with self.cond:
+            if not self.running:
+                raise Exception("mwcansched: stopped, " + func + " not sent")
+            if prio >= PRIO_TELEMETRY and key in self.waiting:
+                self.counters["merged"] += 1
+                return self.waiting[key]
+
+            future = Future()
+            if prio >= PRIO_TELEMETRY:
+                self.waiting[key] = future
+            self.seq += 1
+            heapq.heappush(self.queue, (prio, self.seq, time.monotonic() + self.deadline[prio], key, func, args, future))
+            self.cond.notify()
+        return future
+
+    def call(self, prio, func, *args):
+        return self.submit(prio, func, *args).result()
+
+    def off(self):
+        return self.call(PRIO_SAFETY, "operation", 1, 0)
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
+
+    #########################################
+    # worker
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.running:
+                    for job in self.queue: job[6].set_result(-1)
+                    self.queue = []
+                    self.waiting = {}
+                    return
+                prio, seq, deadline, key, func, args, future = heapq.heappop(self.queue)
+                if self.waiting.get(key) is future:
+                    del self.waiting[key]
+
+            if time.monotonic() > deadline:
+                if prio >= PRIO_TELEMETRY:
+                    logging.debug("mwcansched: drop stale " + func)
+                    self.counters["dropped"] += 1
+                    future.set_result(-1)
+                    continue
+                logging.warning("mwcansched: " + func + " late")
+                self.counters["late"] += 1
+
+            timeout = self.dev.CAN_TIMEOUT
+            self.dev.CAN_TIMEOUT = self.timeout[prio]
+            try:
+                future.set_result(getattr(self.dev, func)(*args))
+            except Exception as err:
+                future.set_exception(err)
+            finally:
+                self.dev.CAN_TIMEOUT = timeout
+            self.counters["done"] += 1
@@ -0,0 +1,188 @@
+############################################################################
+#    This lib is free software; you can redistribute it and/or modify      #
+#    it under the terms of the LGPL                                        #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+############################################################################
+
+# Fixed memory history of measurements of Mean Well CAN devices
+# Use at your own risk !
+
+# Version history
+# agent 19.10.2026  Version 0.1.0: Ring buffers with raw, 1 minute and 1 hour min/max/mean rollups
+
+import logging
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from mwcan import *
+
+######################################################################################
+# Explanations
+######################################################################################
+
+######################################################################################
+# series = mwcanseries(size_raw=3600, size_min=1440, size_hour=720)
+#
+# One register of one device. All memory is allocated at the start (array of double),
+# the oldest values are overwritten:
+#   SERIES_RAW  every sample                          size_raw  samples
+#   SERIES_MIN  min / max / mean per minute           size_min  minutes (1440 = 24 h)
+#   SERIES_HOUR min / max / mean per hour             size_hour hours   (720  = 30 days)
+# Minute and hour values are built while adding, the running minute / hour is
+# part of every query.
+#
+# series.add(t, v)              t = time.time(), v = value
+# series.query(86400)           --> {"res", "t": array, "min": array, "max": array, "mean": array}
+#                                   of the last 24 h, resolution is the finest one covering it
+# series.query(600, SERIES_RAW) --> fixed resolution, for raw min = max = mean = value
+#
+# hist = mwcanhistory(devices, names=SERIES_NAMES)
+# hist.poll()                   --> one pipelined read of all registers of all devices
+# hist.series(dev, "v_out_read").query(3600)
+######################################################################################
+
+SERIES_RAW  = 0
+SERIES_MIN  = 1
+SERIES_HOUR = 2
+
+SERIES_STEP = {SERIES_MIN: 60, SERIES_HOUR: 3600}
+
+#name: (lobyte, hibyte, devices)
+SERIES_REGS = {
+    "v_out_read":    (0x60, 0x00, (DEV_BIC_2200, DEV_NPB)),
+    "i_out_read":    (0x61, 0x00, (DEV_BIC_2200, DEV_NPB)),
+    "temp_read":     (0x62, 0x00, (DEV_BIC_2200, DEV_NPB)),
+    "BIC_fanspeed1": (0x70, 0x00, (DEV_BIC_2200,)),
+    "BIC_fanspeed2": (0x71, 0x00, (DEV_BIC_2200,)),
+}
+SERIES_NAMES = list(SERIES_REGS)
+
+class mwcanring:
+    #fixed size ring of rows (t, min, max, mean)
+
+    def __init__(self, size):
+        self.size  = size
+        self.cols  = [array('d', bytes(8 * size)) for i in range(4)]
+        self.head  = 0 #next row to write
+        self.count = 0
+
+    def append(self, t, vmin, vmax, vmean):
+        h = self.head
+        c = self.cols
+        c[0][h] = t
+        c[1][h] = vmin
+        c[2][h] = vmax
+        c[3][h] = vmean
+        self.head = (h + 1) % self.size
+        if self.count < self.size: self.count += 1
+
+    def since(self, start, step=0):
+        #rows of buckets ending after start (raw: t >= start), oldest first
+        first = (self.head - self.count) % self.size
+        order = [c[first:first + self.count] if first + self.count <= self.size
+                 else c[first:] + c[:self.head] for c in self.cols]
+        i = bisect_right(order[0], start - step) if step else bisect_left(order[0], start)
+        return [c[i:] for c in order]
+
+    def oldest(self):
+        if self.count == 0: return None
+        return self.cols[0][(self.head - self.count) % self.size]
+
+class mwcanseries:
+
+    def __init__(self, size_raw=3600, size_min=1440, size_hour=720):
+        self.rings = {SERIES_RAW: mwcanring(size_raw), SERIES_MIN: mwcanring(size_min), SERIES_HOUR: mwcanring(size_hour)}
+        #running bucket per rollup: [start, min, max, sum, n]
+        self.acc   = {SERIES_MIN: None, SERIES_HOUR: None}
+
+    def add(self, t, v):
+        self.rings[SERIES_RAW].append(t, v, v, v)
+        self.roll(SERIES_MIN, t, v, v, v, 1)
+
+    def roll(self, res, t, vmin, vmax, vsum, n):
+        start = t - t % SERIES_STEP[res]
+        acc = self.acc[res]
+        if acc is not None and acc[0] != start:
+            #bucket done, store it and pass it to the next resolution
+            self.rings[res].append(acc[0], acc[1], acc[2], acc[3] / acc[4])
+            if res == SERIES_MIN:
+                self.roll(SERIES_HOUR, acc[0], acc[1], acc[2], acc[3], acc[4])
+            acc = None
+        if acc is None:
+            self.acc[res] = [start, vmin, vmax, vsum, n]
+            return
+        if vmin < acc[1]: acc[1] = vmin
+        if vmax > acc[2]: acc[2] = vmax
+        acc[3] += vsum
+        acc[4] += n
+
+    def resolution(self, seconds, now):
+        #finest resolution with data back to now - seconds, a ring not full yet has all data
+        for res in [SERIES_RAW, SERIES_MIN]:
+            ring = self.rings[res]
+            if ring.count < ring.size or ring.oldest() <= now - seconds:
+                return res
+        return SERIES_HOUR
+
+    def running(self, res):
+        #buckets of res not in the ring yet, the running minute is part of the running hour
+        macc = self.acc[SERIES_MIN]
+        if res == SERIES_MIN or macc is None:
+            return [] if macc is None else [macc]
+        hacc = self.acc[SERIES_HOUR]
+        mhour = macc[0] - macc[0] % 3600
+        if hacc is None or hacc[0] != mhour:
+            return ([] if hacc is None else [hacc]) + [[mhour] + macc[1:]]
+        return [[hacc[0], min(hacc[1], macc[1]), max(hacc[2], macc[2]), hacc[3] + macc[3], hacc[4] + macc[4]]]
+
+    def query(self, seconds, res=None, now=None):
+        if now is None: now = time.time()
+        if res is None: res = self.resolution(seconds, now)
+        start = now - seconds
+        t, vmin, vmax, vmean = self.rings[res].since(start, SERIES_STEP.get(res, 0))
+        if res != SERIES_RAW:
+            for acc in self.running(res):
+                if acc[0] + SERIES_STEP[res] > start:
+                    t.append(acc[0])
+                    vmin.append(acc[1])
+                    vmax.append(acc[2])
+                    vmean.append(acc[3] / acc[4])
+        return {"res": res, "t": t, "min": vmin, "max": vmax, "mean": vmean}
+
+
+class mwcanhistory:
+
+    def __init__(self, devices, names=SERIES_NAMES, size_raw=3600, size_min=1440, size_hour=720):
+        self.devices = devices
+        self.data    = {} #(dev, name) -> mwcanseries
+        self.regs    = {} #dev -> {(lobyte, hibyte): name}
+        for dev in devices:
+            self.regs[dev] = {}
+            for name in names:
+                lobyte, hibyte, usable = SERIES_REGS[name]
+                if dev.USEDMWHW not in usable: continue
+                self.regs[dev][(lobyte, hibyte)] = name
+                self.data[(dev, name)] = mwcanseries(size_raw, size_min, size_hour)
+
+    def series(self, dev, name):
+        return self.data[(dev, name)]
+
+    def add(self, dev, name, v, t=None):
+        self.data[(dev, name)].add(time.time() if t is None else t, v)
+
+    def poll(self):
+        for dev in self.devices:
+            regs = self.regs[dev]
+            values = dev.can_read_multi(list(regs))
+            t = time.time()
+            for cmd, name in regs.items():
+                v = values[cmd]
+                if v == -1:
+                    logging.debug("mwcanhistory: no reply " + name)
+                    continue
+                if name == "i_out_read": v = dev.i_out_signed(v)
+                self.data[(dev, name)].add(t, v)
@@ -0,0 +1,178 @@
+############################################################################
+#    This lib is free software; you can redistribute it and/or modify      #
+#    it under the terms of the LGPL                                        #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+############################################################################
+
+# Live values of Mean Well CAN devices for other processes via shared memory
+# Use at your own risk !
+
+# Version history
+# agent 19.10.2026  Version 0.1.0: One owner publishes, any process reads a seqlock protected snapshot
+
+import logging
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from mwcan import *
+
+######################################################################################
+# Explanations
+######################################################################################
+
+######################################################################################
+# Only one process talks to the devices (the owner), all others (UI, logger, ...)
+# read the last values from shared memory, no bus access, no IPC round trip.
+#
+# Owner:
+# pub = mwcanpublisher(devices, name=SHM_NAME, period=0.1)
+# pub.start()  --> all SHM_REGS of all devices pipelined every period, or pub.poll() in own loop
+# pub.stop()   --> the segment is removed
+#
+# Reader (other process):
+# shm  = mwcanshmreader(name=SHM_NAME)
+# snap = shm.snapshot()
+# --> {"seq", "time", "devices": {"0x000c0300": {"usedmwdev", "time", "v_out_read", ...}}}
+# values of not answered reads are -1, i_out_read is signed
+# shm.close()
+#
+# Layout (little endian):
+# header  SHM_HEADER: seq, SHM_VERSION, device count, register count, publish time
+# devices SHM_DEVICE: CAN_ADR, usedmwdev, read time, one int32 per SHM_REGS
+#
+# Seqlock: the owner makes seq odd, writes all devices, makes seq even again.
+# A reader copies the segment and accepts the copy only if seq was even and the
+# same before and after, otherwise it copies again.
+######################################################################################
+
+SHM_NAME    = "mwcan"
+SHM_VERSION = 1
+
+#published registers: (name, lobyte, hibyte)
+SHM_REGS = [
+    ("operation",           0x00, 0x00),
+    ("fault_status_read",   0x40, 0x00),
+    ("v_in_read",           0x50, 0x00),
+    ("v_out_read",          0x60, 0x00),
+    ("i_out_read",          0x61, 0x00),
+    ("temp_read",           0x62, 0x00),
+    ("system_status",       0xC1, 0x00),
+    ("BIC_fanspeed1",       0x70, 0x00), #BIC-2200 only
+    ("BIC_fanspeed2",       0x71, 0x00), #BIC-2200 only
+    ("NPB_chg_status_read", 0xB8, 0x00), #NPB only
+]
+SHM_NPB_ONLY = ["NPB_chg_status_read"]
+SHM_BIC_ONLY = ["BIC_fanspeed1", "BIC_fanspeed2"]
+
+SHM_HEADER = struct.Struct("<IHHHxxd")
+SHM_DEVICE = struct.Struct("<IBxxxd" + "i" * len(SHM_REGS))
+
+class mwcanpublisher:
+
+    def __init__(self, devices, name=SHM_NAME, period=0.1):
+        self.devices = devices
+        self.period  = period
+        self.size    = SHM_HEADER.size + SHM_DEVICE.size * len(devices)
+        self.shm     = shared_memory.SharedMemory(name=name, create=True, size=self.size)
+        self.buf     = bytearray(self.size - SHM_HEADER.size) #devices, packed outside the lock
+        self.seq     = 0
+        self.thread  = None
+        self.running = threading.Event()
+        self.regs    = {}
+        for dev in devices:
+            self.regs[dev] = [(name, (lobyte, hibyte)) for name, lobyte, hibyte in SHM_REGS
+                              if not (name in SHM_NPB_ONLY and dev.USEDMWHW != DEV_NPB)
+                              and not (name in SHM_BIC_ONLY and dev.USEDMWHW != DEV_BIC_2200)]
+        self.publish(0.0)
+        logging.info("mwcanpublisher: shared memory " + name + ", " + str(self.size) + " bytes")
+
+    def publish(self, t):
+        #seqlock write of header and all devices
+        mem = self.shm.buf
+        self.seq += 1
+        SHM_HEADER.pack_into(mem, 0, self.seq, SHM_VERSION, len(self.devices), len(SHM_REGS), t)
+        mem[SHM_HEADER.size:self.size] = self.buf
+        self.seq += 1
+        SHM_HEADER.pack_into(mem, 0, self.seq, SHM_VERSION, len(self.devices), len(SHM_REGS), t)
+
+    def poll(self):
+        for i, dev in enumerate(self.devices):
+            regs = self.regs[dev]
+            values = dev.can_read_multi([cmd for name, cmd in regs])
+            t = time.time()
+            row = dict.fromkeys([r[0] for r in SHM_REGS], -1)
+            for name, cmd in regs:
+                v = values[cmd]
+                if name == "i_out_read" and v != -1: v = dev.i_out_signed(v)
+                row[name] = v
+            SHM_DEVICE.pack_into(self.buf, i * SHM_DEVICE.size, dev.CAN_ADR, dev.USEDMWHW, t,
+                                 *[row[r[0]] for r in SHM_REGS])
+        self.publish(time.time())
+
+    #########################################
+    # thread
+    def run(self):
+        while self.running.is_set():
+            t = time.monotonic()
+            self.poll()
+            wait = self.period - (time.monotonic() - t)
+            if wait > 0: time.sleep(wait)
+
+    def start(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, name="mwcanpublisher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class mwcanshmreader:
+
+    def __init__(self, name=SHM_NAME):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            #python < 3.13 registers the segment and would remove it when this process ends
+            from multiprocessing import resource_tracker
+            self.shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+
+    def raw(self, retries=100):
+        #consistent copy of the segment, None if the owner was always writing
+        mem = self.shm.buf
+        for i in range(retries):
+            seq = SHM_HEADER.unpack_from(mem, 0)[0]
+            if seq & 1: continue
+            data = bytes(mem)
+            if seq == SHM_HEADER.unpack_from(mem, 0)[0] == SHM_HEADER.unpack_from(data, 0)[0]:
+                return data
+        return None
+
+    def snapshot(self, retries=100):
+        data = self.raw(retries)
+        if data is None: return None
+        seq, version, count, nregs, t = SHM_HEADER.unpack_from(data, 0)
+        if version != SHM_VERSION or nregs != len(SHM_REGS):
+            raise Exception("mwcanshmreader: segment version " + str(version) + " not supported")
+        devices = {}
+        for i in range(count):
+            row = SHM_DEVICE.unpack_from(data, SHM_HEADER.size + i * SHM_DEVICE.size)
+            d = {"usedmwdev": row[1], "time": row[2]}
+            for (name, lobyte, hibyte), v in zip(SHM_REGS, row[3:]):
+                d[name] = v
+            devices[format(row[0], '#010x')] = d
+        return {"seq": seq, "time": t, "devices": devices}
+
+    def close(self):
+        self.shm.close()
@@ -0,0 +1,184 @@
+############################################################################
+#    This lib is free software; you can redistribute it and/or modify      #
+#    it under the terms of the LGPL                                        #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+############################################################################
+
+# Cached register view of one Mean Well CAN device
+# Use at your own risk !
+
+# Version history
+# agent 19.10.2026  Version 0.1.0: Register cache with freshness per register class, pipelined refresh
+# agent 19.10.2026  Version 0.1.1: expired value is not returned if the read fails
+
+import logging
+import threading
+import time
+from mwcan import *
+
+######################################################################################
+# Explanations
+######################################################################################
+
+######################################################################################
+# state = mwcanstate(candev, ttl=None)
+#
+# Every register is an attribute with the name of the mwcan read function:
+# state.v_out_read, state.i_out_read, state.system_config, state.type_read, ...
+# The cached value is returned while it is fresh, otherwise the register is read.
+# Freshness (seconds) per register class, can be changed with ttl = {class: seconds}:
+#   STATE_STATIC  type, serial, firmware, scaling   never expire
+#   STATE_CONFIG  setpoints, system / curve config  STATE_TTL[STATE_CONFIG]
+#   STATE_STATUS  fault / status bits               STATE_TTL[STATE_STATUS]
+#   STATE_MEASURE voltage, current, temp, fan       STATE_TTL[STATE_MEASURE]
+#
+# state.refresh()                      --> all expired registers read so far, one pipelined batch
+# state.refresh("v_out_read", ...)     --> only these, if expired
+# state.write("BIC_discharge_i", 2000) --> written to the device and the cache
+# state.invalidate()                   --> everything expires, e.g. after writes done directly on candev
+# state.counters = {"hits", "misses", "requests"}
+#
+# Failed reads (-1) are not cached, an expired register returns -1 then, never the
+# old value. Strings (type, serial, ...) are read one by one,
+# they are static so only once.
+######################################################################################
+
+STATE_STATIC  = 0
+STATE_CONFIG  = 1
+STATE_STATUS  = 2
+STATE_MEASURE = 3
+
+STATE_TTL = {STATE_STATIC: None, STATE_CONFIG: 300.0, STATE_STATUS: 0.5, STATE_MEASURE: 0.2}
+
+STATE_ALL = (DEV_BIC_2200, DEV_NPB)
+STATE_BIC = (DEV_BIC_2200,)
+STATE_NPB = (DEV_NPB,)
+
+#name: (lobyte, hibyte, class, devices), lobyte None = string register
+STATE_FIELDS = {
+    "operation":                (0x00, 0x00, STATE_CONFIG,  STATE_ALL),
+    "v_out_set":                (0x20, 0x00, STATE_CONFIG,  STATE_ALL),
+    "i_out_set":                (0x30, 0x00, STATE_CONFIG,  STATE_ALL),
+    "fault_status_read":        (0x40, 0x00, STATE_STATUS,  STATE_ALL),
+    "v_in_read":                (0x50, 0x00, STATE_MEASURE, STATE_ALL),
+    "v_out_read":               (0x60, 0x00, STATE_MEASURE, STATE_ALL),
+    "i_out_read":               (0x61, 0x00, STATE_MEASURE, STATE_ALL),
+    "temp_read":                (0x62, 0x00, STATE_MEASURE, STATE_ALL),
+    "BIC_fanspeed1":            (0x70, 0x00, STATE_MEASURE, STATE_BIC),
+    "BIC_fanspeed2":            (0x71, 0x00, STATE_MEASURE, STATE_BIC),
+    "manu_read":                (None, None, STATE_STATIC,  STATE_ALL),
+    "type_read":                (None, None, STATE_STATIC,  STATE_ALL),
+    "firmware_read":            (0x84, 0x00, STATE_STATIC,  STATE_ALL),
+    "manu_factory_location":    (None, None, STATE_STATIC,  STATE_ALL),
+    "manu_date":                (None, None, STATE_STATIC,  STATE_ALL),
+    "serial_read":              (None, None, STATE_STATIC,  STATE_ALL),
+    "NPB_curve_CC":             (0xB0, 0x00, STATE_CONFIG,  STATE_NPB),
+    "NPB_curve_CV":             (0xB1, 0x00, STATE_CONFIG,  STATE_NPB),
+    "NPB_curve_FV":             (0xB2, 0x00, STATE_CONFIG,  STATE_NPB),
+    "NPB_curve_TC":             (0xB3, 0x00, STATE_CONFIG,  STATE_NPB),
+    "NPB_curve_config":         (0xB4, 0x00, STATE_CONFIG,  STATE_NPB),
+    "NPB_curve_CC_TIMEOUT":     (0xB5, 0x00, STATE_CONFIG,  STATE_NPB),
+    "NPB_curve_CV_TIMEOUT":     (0xB6, 0x00, STATE_CONFIG,  STATE_NPB),
+    "NPB_curve_FV_TIMEOUT":     (0xB7, 0x00, STATE_CONFIG,  STATE_NPB),
+    "NPB_chg_status_read":      (0xB8, 0x00, STATE_STATUS,  STATE_NPB),
+    "system_scaling_factor":    (0xC0, 0x00, STATE_STATIC,  STATE_ALL),
+    "system_status":            (0xC1, 0x00, STATE_STATUS,  STATE_ALL),
+    "system_config":            (0xC2, 0x00, STATE_CONFIG,  STATE_ALL),
+    "BIC_chargemode":           (0x00, 0x01, STATE_CONFIG,  STATE_BIC),
+    "BIC_discharge_v":          (0x20, 0x01, STATE_CONFIG,  STATE_BIC),
+    "BIC_discharge_i":          (0x30, 0x01, STATE_CONFIG,  STATE_BIC),
+    "BIC_bidirectional_config": (0x40, 0x01, STATE_CONFIG,  STATE_BIC),
+}
+
+class mwcanstate:
+
+    def __init__(self, dev, ttl=None):
+        self.dev      = dev
+        self.ttl      = dict(STATE_TTL)
+        if ttl is not None: self.ttl.update(ttl)
+        self.cache    = {} #name -> (value, time)
+        self.lock     = threading.RLock()
+        self.counters = {"hits": 0, "misses": 0, "requests": 0}
+
+    def __getattr__(self, name):
+        #only called for names which are no normal attributes
+        if name not in STATE_FIELDS:
+            raise AttributeError("mwcanstate: no register " + name)
+        return self.get(name)
+
+    def fields(self):
+        return [name for name, f in STATE_FIELDS.items() if self.dev.USEDMWHW in f[3]]
+
+    def fresh(self, name, now):
+        entry = self.cache.get(name)
+        if entry is None or entry[1] is None: return False
+        ttl = self.ttl[STATE_FIELDS[name][2]]
+        return ttl is None or now - entry[1] < ttl
+
+    #########################################
+    # read
+    def get(self, name):
+        if self.dev.USEDMWHW not in STATE_FIELDS[name][3]:
+            raise AttributeError("mwcanstate: " + name + " not available on " + hex(self.dev.CAN_ADR))
+        with self.lock:
+            if self.fresh(name, time.monotonic()):
+                self.counters["hits"] += 1
+                return self.cache[name][0]
+            self.counters["misses"] += 1
+            t = time.monotonic()
+            self.refresh(name)
+            entry = self.cache.get(name)
+            if entry is None or entry[1] is None or entry[1] < t:
+                return -1 #no reply, the cached value is expired
+            return entry[0]
+
+    def refresh(self, *names):
+        #read all expired registers, numbers in one pipelined batch
+        #returns the number of registers read
+        with self.lock:
+            now = time.monotonic()
+            if not names: names = list(self.cache)
+            expired = [name for name in names if not self.fresh(name, now)]
+            if not expired: return 0
+
+            cmds = {}
+            for name in expired:
+                lobyte, hibyte = STATE_FIELDS[name][:2]
+                if lobyte is None:
+                    v = getattr(self.dev, name)()
+                    self.counters["requests"] += 1
+                    if v != "": self.cache[name] = (v, time.monotonic())
+                else:
+                    cmds[(lobyte, hibyte)] = name
+
+            if cmds:
+                values = self.dev.can_read_multi(list(cmds))
+                self.counters["requests"] += len(cmds)
+                t = time.monotonic()
+                for cmd, name in cmds.items():
+                    v = values[cmd]
+                    if v == -1:
+                        logging.debug("mwcanstate: no reply " + name)
+                        continue
+                    if name == "i_out_read": v = self.dev.i_out_signed(v)
+                    self.cache[name] = (v, t)
+            return len(expired)
+
+    #########################################
+    # write / invalidate
+    def write(self, name, val):
+        with self.lock:
+            v = getattr(self.dev, name)(1, val)
+            self.cache[name] = (v, time.monotonic())
+            return v
+
+    def invalidate(self, *names):
+        #expire the registers, they are still refreshed by refresh()
+        with self.lock:
+            for name in (names or list(self.cache)):
+                if name in self.cache:
+                    self.cache[name] = (self.cache[name][0], None)
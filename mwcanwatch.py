@@ -0,0 +1,134 @@
+############################################################################
+#    This lib is free software; you can redistribute it and/or modify      #
+#    it under the terms of the LGPL                                        #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+############################################################################
+
+# Fault and status watchdog for Mean Well CAN devices
+# Use at your own risk !
+
+# Version history
+# agent 19.10.2026  Version 0.1.0: Edge detection of FAULT, SYSTEM_STATUS and CHG_STATUS bits with callbacks
+
+import logging
+import threading
+import time
+from mwcan import *
+
+######################################################################################
+# Explanations
+######################################################################################
+
+######################################################################################
+# watch = mwcanwatch(devices, period=0.1, debounce=2)
+#
+# devices  = list of mwcan instances (can_up done)
+#            Use own mwcan instances for the watchdog if the devices are used by other
+#            threads too, every instance has its own socket and replies are matched
+#            by command code, so they do not disturb each other
+# period   = poll period in seconds
+# debounce = number of polls a bit must keep its new value before the edge is reported
+#
+# watch.on(WATCH_FAULT, FAULT_OTP, handler, EDGE_RISING)
+# handler(dev, group, bit, edge, value) is called from the watchdog thread
+# within one poll period after the change is debounced
+# bit = -1 --> handler is called for every bit of the group
+#
+# Bits already set at the first poll are reported as rising edge
+#
+# watch.start() / watch.stop()  or call watch.poll() from your own loop
+######################################################################################
+
+#Watched registers
+WATCH_FAULT  = 0 #FAULT_*         0x0040
+WATCH_STATUS = 1 #SYSTEM_STATUS_* 0x00C1
+WATCH_CHG    = 2 #CHG_STATUS_*    0x00B8 NPB only
+
+WATCH_CMDS = {WATCH_FAULT: (0x40,0x00), WATCH_STATUS: (0xC1,0x00), WATCH_CHG: (0xB8,0x00)}
+
+EDGE_RISING  = 1
+EDGE_FALLING = 2
+EDGE_BOTH    = 3
+
+class mwcanwatch:
+
+    def __init__(self, devices, period=0.1, debounce=2):
+        self.devices  = devices
+        self.period   = period
+        self.debounce = debounce
+        self.handlers = [] #(group, bit, edge, handler)
+        self.stable   = {} #(dev, group) -> debounced value
+        self.pending  = {} #(dev, group) -> (value, count)
+        self.thread   = None
+        self.running  = threading.Event()
+
+    def on(self, group, bit, handler, edge=EDGE_RISING):
+        self.handlers.append((group, bit, edge, handler))
+
+    def value(self, dev, group):
+        #last debounced value, -1 if not yet known
+        return self.stable.get((dev, group), -1)
+
+    #########################################
+    # poll
+    def poll(self):
+        for dev in self.devices:
+            groups = [WATCH_FAULT, WATCH_STATUS]
+            if dev.USEDMWHW == DEV_NPB: groups.append(WATCH_CHG)
+            values = dev.can_read_multi([WATCH_CMDS[g] for g in groups], self.period)
+            for g in groups:
+                v = values[WATCH_CMDS[g]]
+                if v != -1: self.update(dev, g, v)
+
+    def update(self, dev, group, v):
+        key = (dev, group)
+        old = self.stable.get(key, 0)
+        if v == old:
+            self.stable[key] = v
+            self.pending.pop(key, None)
+            return
+
+        pv, count = self.pending.get(key, (v, 0))
+        count = count + 1 if pv == v else 1
+        if count < self.debounce:
+            self.pending[key] = (v, count)
+            return
+
+        self.pending.pop(key, None)
+        self.stable[key] = v
+        changed = old ^ v
+        logging.debug("mwcanwatch: " + hex(dev.CAN_ADR) + " group " + str(group) + " changed " + format(changed, '#018b'))
+        for hgroup, bit, edge, handler in self.handlers:
+            if hgroup != group: continue
+            for b in range(16):
+                if not is_bit(changed, b) or (bit != -1 and bit != b): continue
+                e = EDGE_RISING if is_bit(v, b) else EDGE_FALLING
+                if edge & e:
+                    try:
+                        handler(dev, group, b, e, v)
+                    except Exception as err:
+                        logging.error("mwcanwatch: handler error " + str(err))
+
+    #########################################
+    # thread
+    def run(self):
+        while self.running.is_set():
+            t = time.monotonic()
+            self.poll()
+            wait = self.period - (time.monotonic() - t)
+            if wait > 0: time.sleep(wait)
+
+    def start(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, name="mwcanwatch", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None